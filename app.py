@@ -1,29 +1,178 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_file, send_from_directory, Response, stream_with_context, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import IntegrityError
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from io import BytesIO, StringIO
+from urllib.request import pathname2url
 import functools
+import gzip
+import hashlib
+import json
 import logging
+import math
 from logging.handlers import RotatingFileHandler
 import os
+import threading
+import time
+import bisect
+import collections
 import csv
+import click
+import numpy as np
 import pandas as pd
 import traceback
 
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只使用 gzip
+    brotli = None
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'cmc-warehouse-2024'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cmc_warehouse.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['TEMPLATES_AUTO_RELOAD'] = True
+# 开发调试时设置 CMC_TEMPLATES_AUTO_RELOAD=1 修改模板即时生效，生产环境模板只编译一次
+app.config['TEMPLATES_AUTO_RELOAD'] = os.environ.get('CMC_TEMPLATES_AUTO_RELOAD') == '1'
+# 日志级别：生产环境默认 INFO，排查问题时设置 CMC_LOG_LEVEL=DEBUG
+app.config['LOG_LEVEL'] = os.environ.get('CMC_LOG_LEVEL', 'INFO').upper()
+# 响应压缩与缓存
+app.config['COMPRESS_MIN_SIZE'] = 500          # 小于该字节数的响应不压缩
+app.config['COMPRESS_GZIP_LEVEL'] = 6
+app.config['COMPRESS_BROTLI_QUALITY'] = 5
+app.config['COMPRESS_MIMETYPES'] = {'text/html', 'text/css', 'text/plain', 'application/javascript', 'text/javascript', 'application/json'}
+app.config['STATIC_MAX_AGE'] = 365 * 24 * 3600  # 带内容哈希的静态资源缓存一年
+# 系统统计缓存：本进程写操作后立即失效，有效期兜底多进程部署时其他进程的写入
+app.config['STATS_CACHE_TTL'] = 60
+app.config['SUPPLIERS_PER_PAGE'] = 50
+# 申请状态推送（SSE）：心跳间隔兼作跨进程状态复查周期，连接到期后由浏览器自动重连
+app.config['SSE_HEARTBEAT'] = 15
+app.config['SSE_MAX_DURATION'] = 30 * 60
+# 每个进程同时保持的推送连接上限（0 为不限）。线程模式部署时应小于线程数，超出的连接只返回当前状态，
+# 由浏览器每隔 SSE_OVERFLOW_RETRY 毫秒重连查询，不长期占用工作线程
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('CMC_SSE_MAX_STREAMS', 0))
+app.config['SSE_OVERFLOW_RETRY'] = 30000
+# 变更事件订阅：下游系统使用 Bearer 令牌访问，未配置时仅允许已登录系统模块的会话
+app.config['CHANGE_FEED_TOKEN'] = os.environ.get('CMC_CHANGE_FEED_TOKEN')
+app.config['CHANGE_FEED_BATCH'] = 1000
+app.config['CHANGE_FEED_MAX_LIMIT'] = 100000
+
+# 多仓库模式：instance/sites.json（或 CMC_SITES_FILE）配置各仓库及其独立的数据库文件，
+# 未配置时为单仓库模式，使用 SQLALCHEMY_DATABASE_URI
+#   {"WH1": {"name": "一号库", "database": "sqlite:///wh1.db"}, ...}
+app.config['SITES'] = {}
+sites_file = os.environ.get('CMC_SITES_FILE', os.path.join(app.instance_path, 'sites.json'))
+if os.path.exists(sites_file):
+    with open(sites_file, encoding='utf-8') as f:
+        app.config['SITES'] = json.load(f)
+app.config['SQLALCHEMY_BINDS'] = {f'site:{code}': site['database'] for code, site in app.config['SITES'].items()}
+app.config['REGION_QUERY_WORKERS'] = 8
+app.config['REGION_QUERY_TIMEOUT'] = 30
+# 库存流水回放校验：每次从数据库读取的行数
+app.config['LEDGER_REPLAY_CHUNK'] = 200000
+# 空器具库龄：库存页面最多每隔该秒数增量刷新一次，库龄分段的上限天数
+app.config['AGING_REFRESH_INTERVAL'] = 300
+app.config['AGING_BUCKET_DAYS'] = [7, 30, 90]
+# 离线登记同步：单次上传条数上限；扫描时间早于该秒数（或晚于服务器时间）时以接收时间入账
+app.config['OFFLINE_SYNC_MAX_BATCH'] = 200
+app.config['OFFLINE_MAX_AGE'] = 7 * 24 * 3600
+# 历史流水批量导入：每个事务写入的行数
+app.config['IMPORT_BATCH_SIZE'] = 20000
+
+# 当前请求所属仓库（单仓库模式为 None）
+def current_site():
+    return g.get('site') if has_app_context() else None
+
+class SiteRoutingSession(FlaskSession):
+    """多仓库模式下按当前仓库选择数据库引擎，报表请求改用只读引擎"""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('reporting'):
+            return report_engine()
+        site = current_site()
+        if bind is None and site:
+            return self._db.engines[f'site:{site}']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': SiteRoutingSession})
+
+def current_engine():
+    site = current_site()
+    return db.engines[f'site:{site}'] if site else db.engine
+
+# 读写引擎使用 WAL 日志模式：读事务读取快照，不阻塞登记等写事务提交
+def enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+with app.app_context():
+    for engine in db.engines.values():
+        event.listen(engine, 'connect', enable_wal)
+
+# 报表只读引擎：以 mode=ro 打开同一数据库文件并设置 query_only，与登记等写操作使用不同的连接池
+_report_engines = {}
+_report_engines_lock = threading.Lock()
+
+def set_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+def report_engine():
+    site = current_site()
+    with _report_engines_lock:
+        engine = _report_engines.get(site)
+        if engine is None:
+            # 先经读写引擎连接一次，确保数据库已切换为 WAL 且共享内存文件存在
+            writer = current_engine()
+            writer.connect().close()
+            path = os.path.abspath(writer.url.database)
+            engine = create_engine(URL.create(
+                'sqlite',
+                database=f'file:{pathname2url(path)}',
+                query={'mode': 'ro', 'uri': 'true'}
+            ))
+            event.listen(engine, 'connect', set_query_only)
+            _report_engines[site] = engine
+    return engine
+
+# 多进程部署时在 fork 之后调用（gunicorn post_fork）：丢弃从主进程继承的连接池，
+# 各工作进程重新打开自己的 SQLite 连接，不与主进程或其他进程共用同一连接
+def dispose_engines():
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    with _report_engines_lock:
+        for engine in _report_engines.values():
+            engine.dispose(close=False)
+
+# 报表路由：本次请求的查询全部走只读引擎
+def reporting_route(f):
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.reporting = True
+        return f(*args, **kwargs)
+    return decorated_function
 
-db = SQLAlchemy(app)
+# 在指定仓库的上下文中执行（命令行、后台线程使用）
+@contextmanager
+def site_context(site):
+    with app.app_context():
+        g.site = site
+        yield
 
 # 配置更详细的日志
 if not os.path.exists('logs'):
     os.mkdir('logs')
 
 # 设置日志级别
-logging.basicConfig(level=logging.DEBUG)
+log_level = getattr(logging, app.config['LOG_LEVEL'], logging.INFO)
+logging.basicConfig(level=log_level)
 
 # 文件处理器
 file_handler = RotatingFileHandler(
@@ -35,11 +184,11 @@ file_handler = RotatingFileHandler(
 file_handler.setFormatter(logging.Formatter(
     '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
 ))
-file_handler.setLevel(logging.DEBUG)
+file_handler.setLevel(log_level)
 
 # 控制台处理器
 console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
+console_handler.setLevel(log_level)
 console_handler.setFormatter(logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 ))
@@ -47,32 +196,159 @@ console_handler.setFormatter(logging.Formatter(
 # 添加到app logger
 app.logger.addHandler(file_handler)
 app.logger.addHandler(console_handler)
-app.logger.setLevel(logging.DEBUG)
+app.logger.setLevel(log_level)
+
+app.logger.info(f'CMC系统启动 - 日志级别 {logging.getLevelName(log_level)}')
 
-app.logger.info('CMC系统启动 - 调试模式')
+# 操作类型、空器具类型编码（库存流水中以小整数存储）
+OPERATION_TYPES = {'in': 1, 'out': 2}
+OPERATION_NAMES = {code: name for name, code in OPERATION_TYPES.items()}
+CONTAINER_TYPES = ['塑箱', '铁料架', '桶', '围板箱']
+CONTAINER_CODES = {name: i + 1 for i, name in enumerate(CONTAINER_TYPES)}
+CARRIERS = ['中世', '中邮', '瑞源', '安吉', '风神', '自送']
+
+def container_name(code):
+    """空器具类型编码转名称"""
+    return CONTAINER_TYPES[code - 1] if code and 0 < code <= len(CONTAINER_TYPES) else None
 
 # 数据库模型
+class Carrier(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+def get_carrier(name):
+    """按名称获取承运商，不存在则新建"""
+    carrier = Carrier.query.filter_by(name=name).first()
+    if carrier is None:
+        carrier = Carrier(name=name)
+        db.session.add(carrier)
+    return carrier
+
 class SupplierInfo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     supplier_code = db.Column(db.String(50), nullable=False)
     mfg_code = db.Column(db.String(50), nullable=False, unique=True)
     supplier_name = db.Column(db.String(100), nullable=False)
-    carrier = db.Column(db.String(100), nullable=False, default='自送')
+    carrier_id = db.Column(db.Integer, db.ForeignKey('carrier.id'), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    carrier_ref = db.relationship('Carrier', lazy='joined')
+
+    @property
+    def carrier(self):
+        return self.carrier_ref.name if self.carrier_ref else None
+
+    @carrier.setter
+    def carrier(self, name):
+        self.carrier_ref = get_carrier(name)
+
 class InventoryLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    operation_type = db.Column(db.String(10), nullable=False)  # 'in' or 'out'
-    container_type = db.Column(db.String(50), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    supplier_code = db.Column(db.String(50), nullable=False)
-    mfg_code = db.Column(db.String(50), nullable=False)
-    supplier_name = db.Column(db.String(100), nullable=False)
-    carrier = db.Column(db.String(100), nullable=False, default='自送')
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier_info.id'), nullable=False)
+    operation_code = db.Column(db.SmallInteger, nullable=False)  # 1=入库 2=出库
+    container_code = db.Column(db.SmallInteger, nullable=False)  # CONTAINER_TYPES 下标+1
+    quantity = db.Column(db.Integer, nullable=False)  # 更正记录可为负数
     operator = db.Column(db.String(50), nullable=False)
     notes = db.Column(db.Text)
+    # 流水只追加不修改：修改、删除以引用原记录的更正流水表示，timestamp 沿用原记录的业务时间
+    corrects_id = db.Column(db.Integer, db.ForeignKey('inventory_log.id'), index=True)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)  # 写入时间（旧数据为空）
+
+    # 库存汇总按 (供应商, 器具, 操作) 分组，索引包含数量列可直接覆盖查询
+    __table_args__ = (
+        db.Index('ix_inventory_log_stock', 'supplier_id', 'container_code', 'operation_code', 'quantity'),
+    )
+
+    supplier = db.relationship('SupplierInfo', lazy='joined')
+
+    @property
+    def operation_type(self):
+        return OPERATION_NAMES.get(self.operation_code)
+
+    @operation_type.setter
+    def operation_type(self, value):
+        self.operation_code = OPERATION_TYPES[value]
+
+    @property
+    def container_type(self):
+        return container_name(self.container_code)
+
+    @container_type.setter
+    def container_type(self, value):
+        self.container_code = CONTAINER_CODES[value]
+
+    # 供应商信息始终取自供应商表，修改供应商后历史记录同步更新
+    @property
+    def supplier_code(self):
+        return self.supplier.supplier_code
+
+    @property
+    def mfg_code(self):
+        return self.supplier.mfg_code
+
+    @property
+    def supplier_name(self):
+        return self.supplier.supplier_name
+
+    @property
+    def carrier(self):
+        return self.supplier.carrier
+
+# 按日汇总的出入库量，随库存流水增量维护，用于趋势报表和统计
+class InventoryRollup(db.Model):
+    bucket_date = db.Column(db.Date, primary_key=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier_info.id'), primary_key=True)
+    container_code = db.Column(db.SmallInteger, primary_key=True)
+    in_qty = db.Column(db.Integer, nullable=False, default=0)
+    out_qty = db.Column(db.Integer, nullable=False, default=0)
+    log_count = db.Column(db.Integer, nullable=False, default=0)
+
+# 空器具库龄批次：入库形成批次，出库按先进先出冲减最早入库的批次
+class InventoryAgingLot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier_info.id'), nullable=False)
+    container_code = db.Column(db.SmallInteger, nullable=False)
+    log_id = db.Column(db.Integer, nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False)
+    remaining = db.Column(db.Integer, nullable=False)  # 为负表示出库超出结存的欠数，之后的入库先冲抵
+
+    __table_args__ = (
+        db.Index('ix_inventory_aging_lot_key', 'supplier_id', 'container_code'),
+    )
+
+# 库龄计算进度：已处理到的流水ID（单行）
+class InventoryAgingCursor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    last_log_id = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime)
+
+# 离线登记回执：客户端为每条登记生成的唯一键，重复上传同一键时不再入账
+class RegistrationReceipt(db.Model):
+    client_key = db.Column(db.String(64), primary_key=True)
+    log_id = db.Column(db.Integer, nullable=False)  # 流水被清理后回执仍保留，防止重新入账
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# 变更事件发件箱：与业务写入同一事务追加，按序号增量同步给下游系统
+class ChangeEvent(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}  # 序号删除后不复用
+    
+    seq = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    event_type = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+
+# 历史流水导入记录：进度随每批流水在同一事务中提交，中断后从已提交的行之后继续
+class LedgerImport(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sha1 = db.Column(db.String(40), nullable=False, index=True)  # 文件内容的 SHA1
+    source = db.Column(db.String(255), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)  # 为空表示未完成
+    last_line = db.Column(db.Integer, nullable=False, default=0)  # 已写入的最后一行行号
+    imported_rows = db.Column(db.Integer, nullable=False, default=0)
 
 class PackingRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -83,7 +359,7 @@ class PackingRequest(db.Model):
     driver_name = db.Column(db.String(50), nullable=False)
     driver_phone = db.Column(db.String(20), nullable=False)
     license_plate = db.Column(db.String(20), nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='pending')
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
     request_id = db.Column(db.String(20), unique=True)
     notes = db.Column(db.Text)  # 确保有这个字段
 
@@ -99,6 +375,14 @@ class PackingRequestItem(db.Model):
     # 关联关系
     packing_request = db.relationship('PackingRequest', backref=db.backref('items', lazy=True))
 
+STATUS_LABELS = {'pending': '待审批', 'approved': '已批准', 'completed': '已完成'}
+
+# 申请状态流转：目标状态 -> 允许的原状态
+STATUS_TRANSITIONS = {
+    'approved': {'pending'},
+    'completed': {'pending', 'approved'}
+}
+
 # 模块密码配置
 MODULE_PASSWORDS = {
     'registration': 'reg123',      # 入库出库登记
@@ -125,6 +409,107 @@ def is_mobile():
     mobile_indicators = ['mobile', 'android', 'iphone', 'ipad', 'ipod']
     return any(indicator in user_agent for indicator in mobile_indicators)
 
+# 多仓库模式：按 ?site= 参数、X-CMC-Site 请求头或会话确定当前仓库，默认第一个仓库
+@app.before_request
+def select_site():
+    sites = app.config['SITES']
+    if not sites or request.endpoint == 'static':
+        return
+    site = request.args.get('site')
+    if site in sites:
+        session['site'] = site
+    else:
+        site = request.headers.get('X-CMC-Site') or session.get('site')
+        if site not in sites:
+            site = next(iter(sites))
+    g.site = site
+
+@app.context_processor
+def inject_site():
+    sites = app.config['SITES']
+    site = current_site()
+    return {
+        'sites': sites,
+        'current_site': site,
+        'current_site_name': sites[site]['name'] if site else None
+    }
+
+# 静态资源地址：附带内容哈希，文件变化后地址随之变化，可放心长期缓存
+_asset_hashes = {}
+
+def asset_url(filename):
+    path = os.path.join(app.static_folder, filename)
+    mtime = os.path.getmtime(path)
+    cached = _asset_hashes.get(filename)
+    if not cached or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.md5(f.read()).hexdigest()[:12])
+        _asset_hashes[filename] = cached
+    return url_for('static', filename=filename, v=cached[1])
+
+@app.context_processor
+def inject_asset_url():
+    return {'asset_url': asset_url}
+
+# 支持条件请求（ETag / 304）的页面
+CONDITIONAL_GET_ENDPOINTS = {'inventory', 'check_request'}
+
+# 根据 Accept-Encoding 选择压缩方式
+def choose_encoding():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress_data(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+# 响应处理：静态资源缓存头、页面 ETag、gzip/brotli 压缩
+@app.after_request
+def optimize_response(response):
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    
+    compressible = response.mimetype in app.config['COMPRESS_MIMETYPES']
+    etag = None
+    
+    if request.endpoint == 'static':
+        if request.args.get('v'):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = app.config['STATIC_MAX_AGE']
+            response.cache_control.immutable = True
+        if compressible:
+            # send_file 默认直接透传文件，压缩前需读入内存
+            response.direct_passthrough = False
+            response.get_data()
+            etag = response.get_etag()[0]
+    elif request.method == 'GET' and request.endpoint in CONDITIONAL_GET_ENDPOINTS:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        etag = hashlib.sha1(response.get_data()).hexdigest()
+    
+    # 流式响应不做处理
+    if not compressible or response.is_streamed:
+        return response
+    response.vary.add('Accept-Encoding')
+    
+    encoding = choose_encoding() if response.content_length and response.content_length >= app.config['COMPRESS_MIN_SIZE'] else None
+    if etag:
+        # 不同编码的响应体不同，ETag 需区分编码
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    
+    if encoding:
+        response.set_data(compress_data(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
 # 首页 - 模块选择
 @app.route('/')
 def index():
@@ -195,148 +580,180 @@ def get_supplier_info(mfg_code):
     else:
         return jsonify({'error': '未找到该发货地代码对应的供应商信息'}), 404
 
+# 供应商字典：发货地代码 → [供应商代码, 供应商名称, 承运商]，页面下载一次后在本地查找，
+# 之后只需带 If-None-Match 校验版本
+@app.route('/api/supplier-dictionary')
+def supplier_dictionary():
+    version = supplier_dictionary_version()
+    if request.if_none_match.contains_weak(version):
+        response = Response(status=304)
+    else:
+        rows = db.session.query(
+            SupplierInfo.mfg_code,
+            SupplierInfo.supplier_code,
+            SupplierInfo.supplier_name,
+            Carrier.name
+        ).outerjoin(Carrier, SupplierInfo.carrier_id == Carrier.id).all()
+        body = json.dumps({
+            'version': version,
+            'fields': ['supplier_code', 'supplier_name', 'carrier'],
+            'suppliers': {mfg_code: [supplier_code, supplier_name, carrier] for mfg_code, supplier_code, supplier_name, carrier in rows}
+        }, ensure_ascii=False, separators=(',', ':'))
+        response = Response(body, mimetype='application/json')
+    # 压缩不改变内容，使用弱 ETag 以便各编码共用
+    response.set_etag(version, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
 # 入库出库登记模块
 @app.route('/registration', methods=['GET', 'POST'])
 @module_required('registration')
 def registration():
     if request.method == 'POST':
-        operation_type = request.form.get('operation_type')
-        container_type = request.form.get('container_type')
-        quantity = request.form.get('quantity')
-        mfg_code = request.form.get('mfg_code')
-        notes = request.form.get('notes')
-        
-        if not all([operation_type, container_type, quantity, mfg_code]):
-            flash('请填写所有必填字段', 'error')
-            return redirect(url_for('registration'))
-        
-        # 获取供应商信息
-        supplier = SupplierInfo.query.filter_by(mfg_code=mfg_code).first()
-        if not supplier:
-            flash('未找到该发货地代码对应的供应商信息，请检查代码或联系管理员', 'error')
-            return redirect(url_for('registration'))
-        
-        # 验证数量
-        try:
-            quantity = int(quantity)
-            if quantity <= 0:
-                flash('数量必须大于0', 'error')
-                return redirect(url_for('registration'))
-        except ValueError:
-            flash('数量必须是有效数字', 'error')
-            return redirect(url_for('registration'))
-        
-        # 如果是出库操作，检查库存是否足够
-        if operation_type == 'out':
-            current_stock = get_mfg_inventory(mfg_code, container_type)
-            if quantity > current_stock:
-                flash(f'出库数量({quantity})超过当前库存({current_stock})，请调整数量', 'error')
-                return redirect(url_for('registration'))
-        
-        # 创建库存记录
-        inventory_log = InventoryLog(
-            operation_type=operation_type,
-            container_type=container_type,
-            quantity=quantity,
-            supplier_code=supplier.supplier_code,
-            mfg_code=mfg_code,
-            supplier_name=supplier.supplier_name,
-            carrier=supplier.carrier,
-            operator='登记员',
-            notes=notes
+        inventory_log, error = register_movement(
+            operation_type=request.form.get('operation_type'),
+            container_type=request.form.get('container_type'),
+            quantity=request.form.get('quantity'),
+            mfg_code=request.form.get('mfg_code'),
+            notes=request.form.get('notes')
         )
+        if error:
+            flash(error, 'error')
+            return redirect(url_for('registration'))
         
-        db.session.add(inventory_log)
         db.session.commit()
+        invalidate_stats()
         
-        operation_text = '入库' if operation_type == 'in' else '出库'
-        flash(f'{operation_text}登记成功！数量：{quantity}', 'success')
+        operation_text = '入库' if inventory_log.operation_type == 'in' else '出库'
+        flash(f'{operation_text}登记成功！数量：{inventory_log.quantity}', 'success')
         return redirect(url_for('registration'))
     
-    container_types = ['塑箱', '铁料架', '桶', '围板箱']
-    
     return render_template('registration.html',
-                         container_types=container_types,
+                         container_types=CONTAINER_TYPES,
                          is_mobile=is_mobile())
 
+# 离线登记批量同步：按提交顺序逐条校验入账，已登记过的唯一键返回 duplicate
+@app.route('/api/registrations', methods=['POST'])
+@module_required('registration')
+def sync_registrations():
+    data = request.get_json(silent=True)
+    entries = data.get('entries') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return jsonify({'error': '请求格式错误'}), 400
+    if len(entries) > app.config['OFFLINE_SYNC_MAX_BATCH']:
+        return jsonify({'error': f'单次最多同步 {app.config["OFFLINE_SYNC_MAX_BATCH"]} 条'}), 413
+    
+    try:
+        results = apply_registration_batch(entries)
+    except IntegrityError:
+        # 同一批登记被另一请求并发提交，回滚后重新处理，已入账的键会返回 duplicate
+        db.session.rollback()
+        results = apply_registration_batch(entries)
+    invalidate_stats()
+    return jsonify({'results': results})
+
+# 登记页面的 Service Worker：须从根路径提供，作用域才能覆盖 /registration
+@app.route('/sw.js')
+def service_worker():
+    response = send_from_directory(app.static_folder, 'js/sw.js', mimetype='application/javascript', max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# 存活检查：进程能处理请求即返回 200，不访问数据库
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+# 就绪检查：各仓库数据库均可读取时返回 200，否则返回 503，负载均衡据此摘除实例
+@app.route('/readyz')
+def readyz():
+    checks = {}
+    for site in app.config['SITES'] or [None]:
+        try:
+            with site_context(site), current_engine().connect() as conn:
+                conn.exec_driver_sql('SELECT 1 FROM inventory_log LIMIT 1')
+            checks[site or 'default'] = 'ok'
+        except Exception as e:
+            app.logger.error(f"就绪检查失败 ({site or '默认'}): {str(e)}")
+            checks[site or 'default'] = 'error'
+    ready = all(status == 'ok' for status in checks.values())
+    return jsonify({'status': 'ok' if ready else 'unavailable', 'databases': checks}), 200 if ready else 503
+
 # 库存查询统计模块 - 去掉权限检查
 @app.route('/inventory')
+@reporting_route
 def inventory():
     # 获取筛选参数
     carrier_filter = request.args.get('carrier')
     supplier_filter = request.args.get('supplier')
     container_type_filter = request.args.get('container_type')
     
-    # 构建基础查询 - 优化查询性能
-    query = db.session.query(
-        InventoryLog.supplier_code,
-        InventoryLog.mfg_code,
-        InventoryLog.supplier_name,
-        InventoryLog.carrier,
-        InventoryLog.container_type,
-        db.func.sum(
-            db.case(
-                (InventoryLog.operation_type == 'in', InventoryLog.quantity),
-                else_=0
-            )
-        ).label('total_in'),
-        db.func.sum(
-            db.case(
-                (InventoryLog.operation_type == 'out', InventoryLog.quantity),
-                else_=0
-            )
-        ).label('total_out')
-    ).group_by(
-        InventoryLog.supplier_code,
-        InventoryLog.mfg_code,
-        InventoryLog.supplier_name, 
-        InventoryLog.carrier, 
-        InventoryLog.container_type
+    inventory_results = query_inventory_balances(
+        carrier=carrier_filter,
+        supplier=supplier_filter,
+        container_type=container_type_filter
     )
     
-    # 应用筛选条件
-    if carrier_filter:
-        query = query.filter(InventoryLog.carrier == carrier_filter)
-    if supplier_filter:
-        query = query.filter(
-            (InventoryLog.supplier_code.contains(supplier_filter)) |
-            (InventoryLog.mfg_code.contains(supplier_filter)) |
-            (InventoryLog.supplier_name.contains(supplier_filter))
-        )
-    if container_type_filter:
-        query = query.filter(InventoryLog.container_type == container_type_filter)
+    # 合并库龄：滞留量（箱·天）= 各批次剩余数量 × 已滞留天数之和
+    refresh_aging_if_due()
+    aging = query_aging_summary()
+    for item in inventory_results:
+        item.update(aging.get((item['supplier_id'], item['container_code']), empty_aging()))
     
-    inventory_data = query.all()
+    # 获取急需返空的前5名供应商（按滞留量降序，数量多且放置久的优先）
+    urgent_return = sorted(inventory_results, key=lambda x: x['stock_days'], reverse=True)[:5]
     
-    # 计算当前库存
-    inventory_results = []
-    for item in inventory_data:
-        current_stock = item.total_in - item.total_out
-        if current_stock > 0:
-            inventory_results.append({
-                'supplier_code': item.supplier_code,
-                'mfg_code': item.mfg_code,
-                'supplier_name': item.supplier_name,
-                'carrier': item.carrier,
-                'container_type': item.container_type,
-                'current_stock': current_stock
-            })
+    return render_template('inventory.html', 
+                         inventory=inventory_results,
+                         urgent_return=urgent_return,  # 新增参数
+                         container_types=CONTAINER_TYPES,
+                         carriers=CARRIERS,
+                         is_mobile=is_mobile())
+
+# 区域库存汇总（多仓库模式）：并行查询各仓库数据库后合并
+@app.route('/region/inventory')
+def region_inventory():
+    sites = app.config['SITES']
+    if not sites:
+        flash('未启用多仓库模式', 'error')
+        return redirect(url_for('inventory'))
+    
+    filters = {
+        'carrier': request.args.get('carrier'),
+        'supplier': request.args.get('supplier'),
+        'container_type': request.args.get('container_type')
+    }
+    futures = {site: region_executor().submit(collect_site_inventory, site, filters) for site in sites}
     
-    # 获取急需返空的前5名供应商（按库存量降序）
-    urgent_return = []
-    if inventory_results:
-        # 按库存量排序
-        sorted_inventory = sorted(inventory_results, key=lambda x: x['current_stock'], reverse=True)
-        urgent_return = sorted_inventory[:5]  # 取前5名
+    inventory_results = []
+    site_summaries = []
+    for site, future in futures.items():
+        try:
+            rows = future.result(timeout=app.config['REGION_QUERY_TIMEOUT'])
+        except Exception as e:
+            app.logger.error(f"查询仓库 {site} 库存错误: {str(e)}")
+            flash(f'{sites[site]["name"]} 数据查询失败，汇总结果不含该仓库', 'error')
+            continue
+        for row in rows:
+            row['site'] = site
+            row['site_name'] = sites[site]['name']
+        inventory_results.extend(rows)
+        site_summaries.append({
+            'site': site,
+            'site_name': sites[site]['name'],
+            'item_count': len(rows),
+            'total_stock': sum(row['current_stock'] for row in rows)
+        })
     
-    container_types = ['塑箱', '铁料架', '桶', '围板箱']
-    carriers = ['中世', '中邮', '瑞源', '安吉', '风神', '自送']
+    # 全区域急需返空前5名
+    urgent_return = sorted(inventory_results, key=lambda x: x['current_stock'], reverse=True)[:5]
     
-    return render_template('inventory.html', 
+    return render_template('region_inventory.html',
                          inventory=inventory_results,
-                         urgent_return=urgent_return,  # 新增参数
-                         container_types=container_types,
-                         carriers=carriers,
+                         urgent_return=urgent_return,
+                         site_summaries=site_summaries,
+                         container_types=CONTAINER_TYPES,
+                         carriers=CARRIERS,
                          is_mobile=is_mobile())
 
 # 返空装箱申请模块 - 去掉权限检查
@@ -407,6 +824,7 @@ def packing_request():
                 db.session.add(request_item)
             
             db.session.commit()
+            invalidate_stats()
             
             flash(f'装箱需求提交成功！申请单号：<strong>{request_id}</strong>，请妥善保存以便查询', 'success')
             return redirect(url_for('packing_request'))
@@ -418,12 +836,9 @@ def packing_request():
             flash('提交申请时发生错误，请查看日志或联系管理员', 'error')
             return redirect(url_for('packing_request'))
     
-    container_types = ['塑箱', '铁料架', '桶', '围板箱']
-    carriers = ['中世', '中邮', '瑞源', '安吉', '风神', '自送']
-    
     return render_template('packing_request.html',
-                         container_types=container_types,
-                         carriers=carriers,
+                         container_types=CONTAINER_TYPES,
+                         carriers=CARRIERS,
                          is_mobile=is_mobile())
 
 # 申请状态查询（无需登录即可访问）
@@ -454,6 +869,30 @@ def check_request():
                          request_info=request_info,
                          is_mobile=is_mobile())
 
+# 申请状态推送（Server-Sent Events），司机页面无需反复刷新
+@app.route('/check-request/<request_id>/events')
+def request_status_events(request_id):
+    # 先取版本号再读状态：两次读取之间发生的变更会使版本号不同，下一次等待立即返回
+    version = status_version(request_id)
+    status = fetch_request_status(request_id)
+    if status is None:
+        return jsonify({'error': '未找到申请'}), 404
+    
+    def event_stream(last_status, version):
+        if not acquire_stream_slot():
+            yield f"retry: {app.config['SSE_OVERFLOW_RETRY']}\n" + status_event(request_id, last_status)
+            return
+        try:
+            yield 'retry: 5000\n' + status_event(request_id, last_status)
+            yield from watch_status(request_id, last_status, version)
+        finally:
+            release_stream_slot()
+    
+    response = Response(stream_with_context(event_stream(status, version)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 关闭 nginx 缓冲
+    return response
+
 # 申请审批管理模块
 @app.route('/approval')
 @module_required('approval')
@@ -499,36 +938,210 @@ def approval():
 def update_request(request_id):
     packing_request = PackingRequest.query.get_or_404(request_id)
     new_status = request.form.get('status')
+    from_status = packing_request.status
     
-    if new_status in ['pending', 'approved', 'completed']:
-        packing_request.status = new_status
-        db.session.commit()
-        flash('申请状态更新成功！', 'success')
+    if new_status not in STATUS_TRANSITIONS:
+        flash('无效的目标状态', 'error')
+        return redirect(url_for('approval'))
+    if from_status not in STATUS_TRANSITIONS[new_status]:
+        flash(f'当前状态({STATUS_LABELS.get(from_status, from_status)})不允许变更为{STATUS_LABELS[new_status]}', 'error')
+        return redirect(url_for('approval'))
+    
+    # 条件中再次限定原状态，期间已被其他操作修改时不覆盖
+    changed = db.session.execute(
+        db.update(PackingRequest)
+        .where(PackingRequest.id == packing_request.id, PackingRequest.status == from_status)
+        .values(status=new_status)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not changed:
+        db.session.rollback()
+        flash('申请状态已被其他操作修改，请刷新后重试', 'error')
+        return redirect(url_for('approval'))
     
+    record_change('packing_request.status_changed', packing_request.id, {
+        'request_id': packing_request.request_id,
+        'from': from_status,
+        'to': new_status
+    })
+    db.session.commit()
+    invalidate_stats()
+    notify_status_change(packing_request.request_id)
+    flash('申请状态更新成功！', 'success')
     return redirect(url_for('approval'))
 
+# 批量更新申请状态（一条 UPDATE、一次提交，返回 JSON 供页面就地更新）
+@app.route('/update-requests', methods=['POST'])
+@module_required('approval')
+def bulk_update_requests():
+    data = request.get_json(silent=True) or {}
+    new_status = data.get('status') or request.form.get('status')
+    raw_ids = data.get('ids') or request.form.getlist('ids[]')
+    
+    if new_status not in STATUS_TRANSITIONS:
+        return jsonify({'error': '无效的目标状态'}), 400
+    if not isinstance(raw_ids, list):
+        return jsonify({'error': '无效的申请ID'}), 400
+    try:
+        ids = {int(i) for i in raw_ids}
+    except (TypeError, ValueError):
+        return jsonify({'error': '无效的申请ID'}), 400
+    if not ids:
+        return jsonify({'error': '请选择申请'}), 400
+    
+    allowed_from = STATUS_TRANSITIONS[new_status]
+    rows = db.session.query(PackingRequest.id, PackingRequest.status, PackingRequest.request_id).filter(
+        PackingRequest.id.in_(ids)
+    ).all()
+    current = {row.id: row.status for row in rows}
+    request_ids = {row.id: row.request_id for row in rows}
+    eligible = [i for i in ids if current.get(i) in allowed_from]
+    skipped = [
+        {'id': i, 'reason': '申请不存在' if i not in current else f'当前状态({STATUS_LABELS.get(current[i], current[i])})不允许变更为{STATUS_LABELS[new_status]}'}
+        for i in sorted(ids) if i not in eligible
+    ]
+    
+    updated = []
+    if eligible:
+        # 按读取到的原状态分组更新，条件中再次限定原状态；只记录实际被更新的行，
+        # 期间已被并发修改的申请归入跳过
+        by_status = collections.defaultdict(list)
+        for i in eligible:
+            by_status[current[i]].append(i)
+        for from_status, group in by_status.items():
+            changed = db.session.execute(
+                db.update(PackingRequest)
+                .where(PackingRequest.id.in_(group), PackingRequest.status == from_status)
+                .values(status=new_status)
+                .returning(PackingRequest.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            for i in changed:
+                record_change('packing_request.status_changed', i, {
+                    'request_id': request_ids[i],
+                    'from': from_status,
+                    'to': new_status
+                })
+            updated.extend(changed)
+        updated.sort()
+        db.session.commit()
+        if updated:
+            invalidate_stats()
+        for i in updated:
+            notify_status_change(request_ids[i])
+        skipped += [{'id': i, 'reason': '申请状态已被其他操作修改'} for i in sorted(set(eligible) - set(updated))]
+    
+    app.logger.info(f"批量更新申请状态为 {new_status}: 成功 {len(updated)} 条, 跳过 {len(skipped)} 条")
+    return jsonify({'status': new_status, 'updated': updated, 'skipped': skipped})
+
 # 系统基础设置模块
 @app.route('/system')
 @module_required('system')
 def system_settings():
-    # 统计信息
-    stats = {
-        'total_requests': PackingRequest.query.count(),
-        'pending_requests': PackingRequest.query.filter_by(status='pending').count(),
-        'today_logs': InventoryLog.query.filter(
-            db.func.date(InventoryLog.timestamp) == datetime.today().date()
-        ).count(),
-        'supplier_count': SupplierInfo.query.count()
-    }
-    
-    # 获取所有供应商信息
-    suppliers = SupplierInfo.query.order_by(SupplierInfo.supplier_code, SupplierInfo.mfg_code).all()
-    
+    # 供应商列表由页面通过 /api/suppliers 分页加载
     return render_template('system.html', 
-                         stats=stats, 
-                         suppliers=suppliers,
+                         stats=get_system_stats(), 
                          is_mobile=is_mobile())
 
+# 供应商列表（分页、搜索）
+@app.route('/api/suppliers')
+@module_required('system')
+def list_suppliers():
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', app.config['SUPPLIERS_PER_PAGE'], type=int), 200)
+    search = request.args.get('q', '').strip()
+    
+    query = SupplierInfo.query
+    if search:
+        query = query.filter(SupplierInfo.id.in_(filter_supplier_ids(supplier=search)))
+    pagination = query.order_by(SupplierInfo.supplier_code, SupplierInfo.mfg_code).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    
+    return jsonify({
+        'items': [{
+            'id': supplier.id,
+            'supplier_code': supplier.supplier_code,
+            'mfg_code': supplier.mfg_code,
+            'supplier_name': supplier.supplier_name,
+            'carrier': supplier.carrier,
+            'created_at': supplier.created_at.strftime('%Y-%m-%d')
+        } for supplier in pagination.items],
+        'page': pagination.page,
+        'pages': pagination.pages,
+        'total': pagination.total
+    })
+
+# 出入库趋势数据（按日/按周，承运商 × 空器具类型），读取日汇总表
+@app.route('/api/trends')
+@module_required('system')
+def inventory_trends():
+    period = request.args.get('period', 'day')
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    carrier = request.args.get('carrier')
+    supplier = request.args.get('supplier')
+    container_type = request.args.get('container_type')
+    
+    if period not in ('day', 'week'):
+        return jsonify({'error': '无效的统计周期'}), 400
+    
+    # 默认最近12个月
+    try:
+        end_date = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else datetime.today().date()
+        start_date = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else end_date - timedelta(days=365)
+    except ValueError:
+        return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+    
+    if period == 'week':
+        # 周一为每周起始日
+        bucket = db.func.date(InventoryRollup.bucket_date, 'weekday 0', '-6 days')
+    else:
+        bucket = InventoryRollup.bucket_date
+    
+    query = db.session.query(
+        bucket.label('bucket'),
+        Carrier.name.label('carrier'),
+        InventoryRollup.container_code,
+        db.func.sum(InventoryRollup.in_qty).label('in_qty'),
+        db.func.sum(InventoryRollup.out_qty).label('out_qty'),
+        db.func.sum(InventoryRollup.log_count).label('count')
+    ).join(
+        SupplierInfo, SupplierInfo.id == InventoryRollup.supplier_id
+    ).join(
+        Carrier, Carrier.id == SupplierInfo.carrier_id
+    ).filter(
+        InventoryRollup.bucket_date >= start_date,
+        InventoryRollup.bucket_date <= end_date
+    ).group_by(
+        bucket, Carrier.name, InventoryRollup.container_code
+    )
+    
+    if carrier:
+        query = query.filter(Carrier.name == carrier)
+    if supplier:
+        query = query.filter(InventoryRollup.supplier_id.in_(filter_supplier_ids(supplier=supplier)))
+    if container_type:
+        query = query.filter(InventoryRollup.container_code == CONTAINER_CODES.get(container_type))
+    
+    rows = []
+    for row in query.order_by(bucket).all():
+        rows.append({
+            'bucket': str(row.bucket),
+            'carrier': row.carrier,
+            'container_type': container_name(row.container_code),
+            'in_qty': row.in_qty,
+            'out_qty': row.out_qty,
+            'count': row.count
+        })
+    
+    return jsonify({
+        'period': period,
+        'date_from': start_date.isoformat(),
+        'date_to': end_date.isoformat(),
+        'rows': rows
+    })
+
 # 添加供应商信息
 @app.route('/system/add-supplier', methods=['POST'])
 @module_required('system')
@@ -556,6 +1169,7 @@ def add_supplier():
     
     db.session.add(supplier)
     db.session.commit()
+    invalidate_stats()
     
     flash('供应商信息添加成功！', 'success')
     return redirect(url_for('system_settings'))
@@ -602,12 +1216,13 @@ def delete_supplier(supplier_id):
     supplier = SupplierInfo.query.get_or_404(supplier_id)
     
     # 检查是否有相关的库存记录
-    if InventoryLog.query.filter_by(mfg_code=supplier.mfg_code).first():
+    if InventoryLog.query.filter_by(supplier_id=supplier.id).first():
         flash('该供应商已有库存记录，无法删除', 'error')
         return redirect(url_for('system_settings'))
     
     db.session.delete(supplier)
     db.session.commit()
+    invalidate_stats()
     
     flash('供应商信息删除成功！', 'success')
     return redirect(url_for('system_settings'))
@@ -615,39 +1230,60 @@ def delete_supplier(supplier_id):
 # 出入库记录查询页面
 @app.route('/system/inventory-logs')
 @module_required('system')
+@reporting_route
 def inventory_logs():
-    # 获取筛选参数
-    operation_type = request.args.get('operation_type')
-    container_type = request.args.get('container_type')
-    date_from = request.args.get('date_from')
-    date_to = request.args.get('date_to')
-    supplier = request.args.get('supplier')
+    rows = build_inventory_log_query(request.args).all()
     
-    # 构建查询
-    query = InventoryLog.query
+    # 更正流水与原记录的业务时间相同，按日期范围取出后归入各自的原记录
+    date_args = {key: request.args.get(key) for key in ('date_from', 'date_to')}
+    corrections = {}
+    for entry in build_inventory_log_query(date_args).filter(
+            InventoryLog.corrects_id.isnot(None)).order_by(InventoryLog.id):
+        corrections.setdefault(entry.corrects_id, []).append(entry)
     
-    if operation_type:
-        query = query.filter(InventoryLog.operation_type == operation_type)
-    if container_type:
-        query = query.filter(InventoryLog.container_type == container_type)
-    if date_from:
-        query = query.filter(InventoryLog.timestamp >= datetime.strptime(date_from, '%Y-%m-%d'))
-    if date_to:
-        end_date = datetime.strptime(date_to, '%Y-%m-%d')
-        end_date = end_date.replace(hour=23, minute=59, second=59)
-        query = query.filter(InventoryLog.timestamp <= end_date)
-    if supplier:
-        query = query.filter(
-            (InventoryLog.supplier_code.contains(supplier)) |
-            (InventoryLog.mfg_code.contains(supplier)) |
-            (InventoryLog.supplier_name.contains(supplier))
-        )
+    # 筛选条件只命中更正流水时同样显示其原记录
+    originals = [entry for entry in rows if entry.corrects_id is None]
+    missing = {entry.corrects_id for entry in rows if entry.corrects_id} - {entry.id for entry in originals}
+    if missing:
+        originals += InventoryLog.query.filter(InventoryLog.id.in_(missing)).all()
     
-    logs = query.order_by(InventoryLog.timestamp.desc()).all()
+    # 每条原记录显示合并更正后的当前状态，已删除的保留并标记
+    logs = []
+    for original in originals:
+        entries = corrections.get(original.id, [])
+        current = net_log_state(original, entries)
+        log = current or original
+        log.correction_count = len(entries)
+        log.deleted = current is None
+        logs.append(log)
+    logs.sort(key=lambda log: log.timestamp, reverse=True)
     
     return render_template('inventory_logs.html',
                          logs=logs,
-                         container_types=['塑箱', '铁料架', '桶', '围板箱'],
+                         container_types=CONTAINER_TYPES,
+                         is_mobile=is_mobile())
+
+# 库存流水回放校验报告
+@app.route('/system/ledger-check')
+@module_required('system')
+@reporting_route
+def ledger_check():
+    start = time.perf_counter()
+    report = replay_ledger()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    anomalies = ledger_anomalies(report)
+    
+    summary = {
+        'movements': int(report['movements'].sum()),
+        'keys': len(report),
+        'negative_keys': int((report['min_balance'] < 0).sum()),
+        'mismatch_keys': int(report['mismatch'].sum()),
+        'aging_checked': bool(report['aging_stock'].notna().any()),
+        'elapsed_ms': elapsed_ms
+    }
+    return render_template('ledger_check.html',
+                         summary=summary,
+                         anomalies=anomalies.to_dict('records'),
                          is_mobile=is_mobile())
 
 # 编辑出入库记录
@@ -655,39 +1291,76 @@ def inventory_logs():
 @module_required('system')
 def edit_inventory_log(log_id):
     log = InventoryLog.query.get_or_404(log_id)
+    if log.corrects_id:
+        # 更正流水本身不再更正，转到原记录
+        return redirect(url_for('edit_inventory_log', log_id=log.corrects_id))
+    corrections = log_corrections(log)
+    current = net_log_state(log, corrections)
+    if current is None:
+        flash('该记录已删除，不能再修改', 'error')
+        return redirect(url_for('inventory_logs'))
     
     if request.method == 'POST':
-        # 更新记录
-        log.operation_type = request.form.get('operation_type')
-        log.container_type = request.form.get('container_type')
-        log.quantity = int(request.form.get('quantity'))
-        log.mfg_code = request.form.get('mfg_code')
-        log.notes = request.form.get('notes')
+        operation_type = request.form.get('operation_type')
+        container_type = request.form.get('container_type')
+        if operation_type not in OPERATION_TYPES or container_type not in CONTAINER_CODES:
+            flash('无效的操作类型或空器具类型', 'error')
+            return redirect(url_for('edit_inventory_log', log_id=log_id))
+        
+        supplier = SupplierInfo.query.filter_by(mfg_code=request.form.get('mfg_code')).first()
+        if not supplier:
+            flash('未找到该发货地代码对应的供应商信息', 'error')
+            return redirect(url_for('edit_inventory_log', log_id=log_id))
         
-        # 更新供应商信息
-        supplier = SupplierInfo.query.filter_by(mfg_code=log.mfg_code).first()
-        if supplier:
-            log.supplier_code = supplier.supplier_code
-            log.supplier_name = supplier.supplier_name
-            log.carrier = supplier.carrier
+        # 数量校验与登记一致；删除记录请使用删除操作
+        try:
+            quantity = int(request.form.get('quantity'))
+        except (TypeError, ValueError):
+            flash('数量必须是有效数字', 'error')
+            return redirect(url_for('edit_inventory_log', log_id=log_id))
+        if quantity <= 0:
+            flash('数量必须大于0', 'error')
+            return redirect(url_for('edit_inventory_log', log_id=log_id))
+        
+        # 不改动原记录，追加更正流水（汇总表、库龄等按增量计入）
+        entries = correct_inventory_log(log, current, (
+            OPERATION_TYPES[operation_type],
+            CONTAINER_CODES[container_type],
+            supplier,
+            quantity,
+            request.form.get('notes')
+        ))
+        if not entries:
+            flash('记录没有变化', 'success')
+            return redirect(url_for('inventory_logs'))
         
         db.session.commit()
-        flash('记录更新成功！', 'success')
+        invalidate_stats()
+        flash(f'记录更正成功！已追加 {len(entries)} 条更正流水', 'success')
         return redirect(url_for('inventory_logs'))
     
     return render_template('edit_inventory_log.html',
                          log=log,
-                         container_types=['塑箱', '铁料架', '桶', '围板箱'],
+                         current=current,
+                         corrections=corrections,
+                         container_types=CONTAINER_TYPES,
                          is_mobile=is_mobile())
 
-# 删除出入库记录
+# 删除出入库记录：追加冲销流水，原记录保留
 @app.route('/system/delete-inventory-log/<int:log_id>', methods=['POST'])
 @module_required('system')
 def delete_inventory_log(log_id):
     log = InventoryLog.query.get_or_404(log_id)
-    db.session.delete(log)
+    if log.corrects_id:
+        log = db.session.get(InventoryLog, log.corrects_id)
+    current = net_log_state(log, log_corrections(log))
+    if current is None:
+        flash('该记录已删除', 'error')
+        return redirect(url_for('inventory_logs'))
+    correct_inventory_log(log, current, None)
     db.session.commit()
-    flash('记录删除成功！', 'success')
+    invalidate_stats()
+    flash('记录删除成功！已追加冲销流水', 'success')
     return redirect(url_for('inventory_logs'))
 
 # 清理过期记录
@@ -709,6 +1382,10 @@ def cleanup_old_records():
             # 删除出入库记录
             logs_deleted = InventoryLog.query.filter(InventoryLog.timestamp < cutoff_datetime).delete()
             deleted_count += logs_deleted
+            # 截止时间为当日零点，之前的日汇总整体删除
+            InventoryRollup.query.filter(InventoryRollup.bucket_date < cutoff_datetime.date()).delete()
+            record_change('inventory_log.purged', 0, {'before': cutoff_datetime.isoformat(), 'count': logs_deleted})
+            invalidate_aging()
         
         if record_type in ['all', 'packing_requests']:
             # 删除装箱申请记录（先删除关联的子记录）
@@ -721,6 +1398,7 @@ def cleanup_old_records():
                 deleted_count += 1
         
         db.session.commit()
+        invalidate_stats()
         flash(f'成功删除 {deleted_count} 条过期记录', 'success')
     
     except Exception as e:
@@ -730,53 +1408,31 @@ def cleanup_old_records():
     
     return redirect(url_for('system_settings'))
 
+# 辅助函数：按各列最长内容调整 Excel 工作表列宽（导出共用）
+def autofit_columns(worksheet):
+    for column in worksheet.columns:
+        max_length = max((len(str(cell.value)) for cell in column if cell.value is not None), default=0)
+        worksheet.column_dimensions[column[0].column_letter].width = max_length + 2
+
 # 导出库存数据 - 使用send_file修复版
 @app.route('/system/export-inventory')
 @module_required('system')
+@reporting_route
 def export_inventory():
     try:
         app.logger.info("开始导出库存数据到Excel")
         
-        # 获取所有库存数据
-        inventory_data = db.session.query(
-            InventoryLog.supplier_code,
-            InventoryLog.mfg_code,
-            InventoryLog.supplier_name,
-            InventoryLog.carrier,
-            InventoryLog.container_type,
-            db.func.sum(
-                db.case(
-                    (InventoryLog.operation_type == 'in', InventoryLog.quantity),
-                    else_=0
-                )
-            ).label('total_in'),
-            db.func.sum(
-                db.case(
-                    (InventoryLog.operation_type == 'out', InventoryLog.quantity),
-                    else_=0
-                )
-            ).label('total_out')
-        ).group_by(
-            InventoryLog.supplier_code,
-            InventoryLog.mfg_code,
-            InventoryLog.supplier_name, 
-            InventoryLog.carrier, 
-            InventoryLog.container_type
-        ).all()
-
         # 转换为DataFrame
         data = []
-        for item in inventory_data:
-            current_stock = item.total_in - item.total_out
-            if current_stock > 0:
-                data.append({
-                    '供应商代码': item.supplier_code,
-                    '发货地代码': item.mfg_code,
-                    '供应商名称': item.supplier_name,
-                    '承运商': item.carrier,
-                    '空器具类型': item.container_type,
-                    '当前库存': current_stock
-                })
+        for item in query_inventory_balances():
+            data.append({
+                '供应商代码': item['supplier_code'],
+                '发货地代码': item['mfg_code'],
+                '供应商名称': item['supplier_name'],
+                '承运商': item['carrier'],
+                '空器具类型': item['container_type'],
+                '当前库存': item['current_stock']
+            })
 
         if not data:
             flash('没有可导出的库存数据', 'error')
@@ -794,19 +1450,7 @@ def export_inventory():
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             df.to_excel(writer, sheet_name='库存数据', index=False)
             
-            # 自动调整列宽
-            worksheet = writer.sheets['库存数据']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+            autofit_columns(writer.sheets['库存数据'])
         
         output.seek(0)
         
@@ -831,38 +1475,12 @@ def export_inventory():
 # 导出出入库记录 - 使用send_file修复版
 @app.route('/system/export-inventory-logs')
 @module_required('system')
+@reporting_route
 def export_inventory_logs():
     try:
         app.logger.info("开始导出出入库记录到Excel")
         
-        # 获取筛选参数
-        operation_type = request.args.get('operation_type')
-        container_type = request.args.get('container_type')
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        supplier = request.args.get('supplier')
-        
-        # 构建查询
-        query = InventoryLog.query
-        
-        if operation_type:
-            query = query.filter(InventoryLog.operation_type == operation_type)
-        if container_type:
-            query = query.filter(InventoryLog.container_type == container_type)
-        if date_from:
-            query = query.filter(InventoryLog.timestamp >= datetime.strptime(date_from, '%Y-%m-%d'))
-        if date_to:
-            end_date = datetime.strptime(date_to, '%Y-%m-%d')
-            end_date = end_date.replace(hour=23, minute=59, second=59)
-            query = query.filter(InventoryLog.timestamp <= end_date)
-        if supplier:
-            query = query.filter(
-                (InventoryLog.supplier_code.contains(supplier)) |
-                (InventoryLog.mfg_code.contains(supplier)) |
-                (InventoryLog.supplier_name.contains(supplier))
-            )
-        
-        logs = query.order_by(InventoryLog.timestamp.desc()).all()
+        logs = build_inventory_log_query(request.args).order_by(InventoryLog.timestamp.desc()).all()
         
         # 转换为DataFrame
         data = []
@@ -877,7 +1495,8 @@ def export_inventory_logs():
                 '供应商名称': log.supplier_name,
                 '承运商': log.carrier,
                 '操作员': log.operator,
-                '备注': log.notes or ''
+                '备注': log.notes or '',
+                '更正原记录': log.corrects_id or ''
             })
         
         if not data:
@@ -896,19 +1515,7 @@ def export_inventory_logs():
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             df.to_excel(writer, sheet_name='出入库记录', index=False)
             
-            # 自动调整列宽
-            worksheet = writer.sheets['出入库记录']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+            autofit_columns(writer.sheets['出入库记录'])
         
         output.seek(0)
         
@@ -930,6 +1537,100 @@ def export_inventory_logs():
         flash(f'导出数据时发生错误，请查看日志', 'error')
         return redirect(url_for('system_settings'))
 
+# 导出库龄分析：各供应商、空器具类型剩余库存按滞留天数分段
+@app.route('/system/export-inventory-aging')
+@module_required('system')
+@reporting_route
+def export_inventory_aging():
+    try:
+        app.logger.info("开始导出库龄分析到Excel")
+        
+        refresh_aging()
+        aging = query_aging_summary()
+        labels = aging_bucket_labels()
+        
+        data = []
+        for item in query_inventory_balances():
+            item_aging = aging.get((item['supplier_id'], item['container_code']), empty_aging())
+            row = {
+                '供应商代码': item['supplier_code'],
+                '发货地代码': item['mfg_code'],
+                '供应商名称': item['supplier_name'],
+                '承运商': item['carrier'],
+                '空器具类型': item['container_type'],
+                '当前库存': item['current_stock']
+            }
+            row.update(zip(labels, item_aging['aging_buckets']))
+            row['平均滞留天数'] = item_aging['avg_age_days']
+            row['最长滞留天数'] = item_aging['max_age_days']
+            row['滞留量(箱·天)'] = item_aging['stock_days']
+            data.append(row)
+        
+        if not data:
+            flash('没有可导出的库存数据', 'error')
+            return redirect(url_for('system_settings'))
+        
+        app.logger.info(f"准备导出 {len(data)} 条库龄记录到Excel")
+        
+        # 按滞留量降序，急需返空的排在前面
+        df = pd.DataFrame(data).sort_values('滞留量(箱·天)', ascending=False)
+        
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df.to_excel(writer, sheet_name='库龄分析', index=False)
+            
+            autofit_columns(writer.sheets['库龄分析'])
+        
+        output.seek(0)
+        
+        filename = f'CMC库龄分析_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
+        
+        return send_file(
+            output,
+            as_attachment=True,
+            download_name=filename,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        
+    except Exception as e:
+        error_msg = f"导出库龄分析错误: {str(e)}"
+        app.logger.error(error_msg)
+        app.logger.error(traceback.format_exc())
+        flash(f'导出数据时发生错误，请查看日志', 'error')
+        return redirect(url_for('system_settings'))
+
+# 变更事件订阅（NDJSON 流）：返回序号大于 after 的事件，下游按最后一条的 seq 继续拉取
+@app.route('/api/changes')
+def change_feed():
+    token = app.config['CHANGE_FEED_TOKEN']
+    auth = request.headers.get('Authorization', '')
+    if not (session.get('system_access') or (token and auth == f'Bearer {token}')):
+        return jsonify({'error': '未授权'}), 401
+    
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', 10000, type=int), app.config['CHANGE_FEED_MAX_LIMIT'])
+    batch_size = app.config['CHANGE_FEED_BATCH']
+    
+    def generate(last_seq, remaining):
+        while remaining > 0:
+            batch = db.session.query(
+                ChangeEvent.seq, ChangeEvent.created_at, ChangeEvent.event_type, ChangeEvent.entity_id, ChangeEvent.payload
+            ).filter(ChangeEvent.seq > last_seq).order_by(ChangeEvent.seq).limit(min(batch_size, remaining)).all()
+            db.session.close()
+            if not batch:
+                return
+            lines = []
+            for event in batch:
+                lines.append(
+                    f'{{"seq":{event.seq},"created_at":"{event.created_at.isoformat()}",'
+                    f'"type":{json.dumps(event.event_type)},"entity_id":{event.entity_id},"data":{event.payload}}}\n'
+                )
+            yield ''.join(lines)
+            last_seq = batch[-1].seq
+            remaining -= len(batch)
+    
+    return Response(stream_with_context(generate(after, limit)), mimetype='application/x-ndjson')
+
 # 导出功能测试路由
 @app.route('/system/test-export')
 def test_export():
@@ -973,21 +1674,135 @@ def test_export():
 # 获取特定MFG代码的库存（用于前端验证）
 @app.route('/api/stock/<mfg_code>/<container_type>')
 def get_stock(mfg_code, container_type):
-    # 计算入库总量
-    in_total = db.session.query(db.func.sum(InventoryLog.quantity)).filter(
-        InventoryLog.mfg_code == mfg_code,
-        InventoryLog.container_type == container_type,
-        InventoryLog.operation_type == 'in'
-    ).scalar() or 0
-    
-    # 计算出库总量
-    out_total = db.session.query(db.func.sum(InventoryLog.quantity)).filter(
-        InventoryLog.mfg_code == mfg_code,
-        InventoryLog.container_type == container_type,
-        InventoryLog.operation_type == 'out'
-    ).scalar() or 0
-    
-    return jsonify({'current_stock': in_total - out_total})
+    return jsonify({'current_stock': get_mfg_inventory(mfg_code, container_type)})
+
+# 某发货地代码各类空器具的当前库存，切换器具类型时页面无需再次请求
+@app.route('/api/stock/<mfg_code>')
+def get_stock_by_container(mfg_code):
+    stock = {container_type: 0 for container_type in CONTAINER_TYPES}
+    supplier_id = db.session.query(SupplierInfo.id).filter_by(mfg_code=mfg_code).scalar()
+    if supplier_id:
+        rows = db.session.query(
+            InventoryLog.container_code,
+            db.func.sum(signed_quantity())
+        ).filter(InventoryLog.supplier_id == supplier_id).group_by(InventoryLog.container_code)
+        for container_code, quantity in rows:
+            stock[container_name(container_code)] = quantity
+    return jsonify({'stock': stock})
+
+# 辅助函数：供应商字典版本，供应商增删改或承运商变化后随之改变
+def supplier_dictionary_version():
+    count, max_id, last_updated = db.session.query(
+        db.func.count(SupplierInfo.id),
+        db.func.max(SupplierInfo.id),
+        db.func.max(SupplierInfo.updated_at)
+    ).one()
+    return hashlib.sha1(f'{count}:{max_id}:{last_updated}'.encode()).hexdigest()[:16]
+
+# 辅助函数：JSON 字段是否为字符串或整数（布尔值不算）
+def is_text_or_int(value):
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+# 辅助函数：校验并写入一条出入库登记（同时更新汇总表和变更事件，不提交），返回 (记录, 错误信息)
+def register_movement(operation_type, container_type, quantity, mfg_code, notes=None, timestamp=None):
+    # 离线同步提交的是 JSON，字段可能是列表、对象或布尔值，这类值整条拒绝
+    if not all(value is None or is_text_or_int(value) for value in (operation_type, container_type, quantity, mfg_code, notes)):
+        return None, '字段格式错误'
+    if not all([operation_type, container_type, quantity, mfg_code]):
+        return None, '请填写所有必填字段'
+    
+    if operation_type not in OPERATION_TYPES or container_type not in CONTAINER_CODES:
+        return None, '无效的操作类型或空器具类型'
+    
+    # 获取供应商信息
+    supplier = SupplierInfo.query.filter_by(mfg_code=mfg_code).first()
+    if not supplier:
+        return None, '未找到该发货地代码对应的供应商信息，请检查代码或联系管理员'
+    
+    # 验证数量
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return None, '数量必须是有效数字'
+    if quantity <= 0:
+        return None, '数量必须大于0'
+    
+    # 如果是出库操作，检查库存是否足够
+    if operation_type == 'out':
+        current_stock = get_mfg_inventory(mfg_code, container_type)
+        if quantity > current_stock:
+            return None, f'出库数量({quantity})超过当前库存({current_stock})，请调整数量'
+    
+    # 创建库存记录
+    inventory_log = InventoryLog(
+        operation_type=operation_type,
+        container_type=container_type,
+        quantity=quantity,
+        supplier=supplier,
+        operator='登记员',
+        notes=str(notes) if notes is not None else None
+    )
+    if timestamp:
+        inventory_log.timestamp = timestamp
+    
+    db.session.add(inventory_log)
+    db.session.flush()
+    update_rollup(inventory_log)
+    record_change('inventory_log.created', inventory_log.id, log_payload(inventory_log))
+    return inventory_log, None
+
+# 辅助函数：离线登记的扫描时间（客户端 ISO 格式），缺失或超出允许范围时返回 None（按接收时间入账）
+def parse_recorded_at(value):
+    try:
+        recorded_at = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if recorded_at.tzinfo:
+        recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+    now = datetime.utcnow()
+    if not now - timedelta(seconds=app.config['OFFLINE_MAX_AGE']) <= recorded_at <= now + timedelta(minutes=5):
+        return None
+    return recorded_at
+
+# 辅助函数：在一个事务中处理一批离线登记，返回每条的处理结果
+def apply_registration_batch(entries):
+    keys = [str(entry.get('key') or '') if isinstance(entry, dict) and is_text_or_int(entry.get('key')) else ''
+            for entry in entries]
+    recorded = {receipt.client_key for receipt in RegistrationReceipt.query.filter(
+        RegistrationReceipt.client_key.in_([key for key in keys if key]))}
+    
+    results = []
+    for key, entry in zip(keys, entries):
+        if not key or len(key) > 64:
+            results.append({'key': key, 'status': 'rejected', 'message': '缺少登记唯一键'})
+            continue
+        if key in recorded:
+            results.append({'key': key, 'status': 'duplicate'})
+            continue
+        
+        inventory_log, error = register_movement(
+            operation_type=entry.get('operation_type'),
+            container_type=entry.get('container_type'),
+            quantity=entry.get('quantity'),
+            mfg_code=entry.get('mfg_code'),
+            notes=entry.get('notes'),
+            timestamp=parse_recorded_at(entry.get('recorded_at'))
+        )
+        if error:
+            results.append({'key': key, 'status': 'rejected', 'message': error})
+            continue
+        db.session.add(RegistrationReceipt(client_key=key, log_id=inventory_log.id))
+        recorded.add(key)
+        results.append({
+            'key': key,
+            'status': 'created',
+            'log_id': inventory_log.id,
+            'operation_type': inventory_log.operation_type,
+            'quantity': inventory_log.quantity
+        })
+    
+    db.session.commit()
+    return results
 
 # 辅助函数：获取特定MFG代码的库存
 def get_mfg_inventory(mfg_code, container_type):
@@ -995,25 +1810,899 @@ def get_mfg_inventory(mfg_code, container_type):
     获取特定MFG代码和空器具类型的当前库存
     """
     try:
-        # 计算入库总量
-        in_total = db.session.query(db.func.sum(InventoryLog.quantity)).filter(
-            InventoryLog.mfg_code == mfg_code,
-            InventoryLog.container_type == container_type,
-            InventoryLog.operation_type == 'in'
-        ).scalar() or 0
+        supplier = SupplierInfo.query.filter_by(mfg_code=mfg_code).first()
+        container_code = CONTAINER_CODES.get(container_type)
+        if not supplier or not container_code:
+            return 0
         
-        # 计算出库总量
-        out_total = db.session.query(db.func.sum(InventoryLog.quantity)).filter(
-            InventoryLog.mfg_code == mfg_code,
-            InventoryLog.container_type == container_type,
-            InventoryLog.operation_type == 'out'
+        # 入库减出库，一次聚合完成
+        stock = db.session.query(db.func.sum(signed_quantity())).filter(
+            InventoryLog.supplier_id == supplier.id,
+            InventoryLog.container_code == container_code
         ).scalar() or 0
         
-        return in_total - out_total
+        return stock
     except Exception as e:
         app.logger.error(f"计算库存错误: {str(e)}")
         return 0
 
+# 辅助函数：带符号的数量（入库为正、出库为负）
+def signed_quantity():
+    return db.case(
+        (InventoryLog.operation_code == OPERATION_TYPES['in'], InventoryLog.quantity),
+        else_=-InventoryLog.quantity
+    )
+
+# 申请状态变更通知：本进程内通过条件变量即时唤醒等待的 SSE 连接
+_status_condition = threading.Condition()
+_status_versions = {}
+
+def notify_status_change(request_id):
+    key = (current_site(), request_id)
+    with _status_condition:
+        _status_versions[key] = _status_versions.get(key, 0) + 1
+        _status_condition.notify_all()
+
+def status_version(request_id):
+    with _status_condition:
+        return _status_versions.get((current_site(), request_id), 0)
+
+def wait_status_change(request_id, version, timeout):
+    """等待指定申请的状态变更通知，返回 (是否变更, 最新版本号)"""
+    key = (current_site(), request_id)
+    with _status_condition:
+        _status_condition.wait_for(lambda: _status_versions.get(key, 0) != version, timeout)
+        current = _status_versions.get(key, 0)
+    return current != version, current
+
+def fetch_request_status(request_id):
+    status = db.session.query(PackingRequest.status).filter_by(request_id=request_id).scalar()
+    # 长连接期间不占用数据库连接
+    db.session.close()
+    return status
+
+# 推送连接：等待状态变更并逐条产出事件，到期或申请完成后结束
+def watch_status(request_id, last_status, version):
+    deadline = time.monotonic() + app.config['SSE_MAX_DURATION']
+    while last_status != 'completed' and time.monotonic() < deadline:
+        changed, version = wait_status_change(request_id, version, app.config['SSE_HEARTBEAT'])
+        # 超时也复查一次，兼顾其他进程中发生的状态变更
+        current = fetch_request_status(request_id)
+        if current is None:
+            return
+        if current != last_status:
+            last_status = current
+            yield status_event(request_id, current)
+        elif not changed:
+            yield ': keepalive\n\n'
+
+# 本进程当前保持的推送连接数，受 SSE_MAX_STREAMS 限制
+_active_streams = 0
+_active_streams_lock = threading.Lock()
+
+def acquire_stream_slot():
+    global _active_streams
+    limit = app.config['SSE_MAX_STREAMS']
+    with _active_streams_lock:
+        if limit and _active_streams >= limit:
+            return False
+        _active_streams += 1
+    return True
+
+def release_stream_slot():
+    global _active_streams
+    with _active_streams_lock:
+        _active_streams -= 1
+
+def status_event(request_id, status):
+    return f"event: status\ndata: {json.dumps({'request_id': request_id, 'status': status})}\n\n"
+
+# 系统统计：一次查询得到全部计数，结果缓存至下次写操作
+_stats_cache = {}
+
+def invalidate_stats():
+    _stats_cache.clear()
+
+def get_system_stats():
+    today = datetime.today().date()
+    cached = _stats_cache.get(current_site())
+    if cached and cached['date'] == today and time.monotonic() - cached['at'] < app.config['STATS_CACHE_TTL']:
+        return cached['value']
+    
+    row = db.session.execute(db.select(
+        db.select(db.func.count()).select_from(PackingRequest)
+            .scalar_subquery().label('total_requests'),
+        db.select(db.func.count()).select_from(PackingRequest).where(PackingRequest.status == 'pending')
+            .scalar_subquery().label('pending_requests'),
+        db.select(db.func.coalesce(db.func.sum(InventoryRollup.log_count), 0)).where(InventoryRollup.bucket_date == today)
+            .scalar_subquery().label('today_logs'),
+        db.select(db.func.count()).select_from(SupplierInfo)
+            .scalar_subquery().label('supplier_count')
+    )).one()
+    
+    stats = dict(row._mapping)
+    _stats_cache[current_site()] = {'date': today, 'at': time.monotonic(), 'value': stats}
+    return stats
+
+# 辅助函数：追加变更事件（随当前事务一起提交）
+def record_change(event_type, entity_id, payload):
+    db.session.add(ChangeEvent(
+        event_type=event_type,
+        entity_id=entity_id,
+        payload=json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    ))
+
+def log_payload(log):
+    return {
+        'id': log.id,
+        'timestamp': log.timestamp.isoformat(),
+        'operation_type': log.operation_type,
+        'container_type': log.container_type,
+        'quantity': log.quantity,
+        'supplier_code': log.supplier_code,
+        'mfg_code': log.mfg_code,
+        'supplier_name': log.supplier_name,
+        'carrier': log.carrier,
+        'operator': log.operator,
+        'notes': log.notes,
+        'corrects_id': log.corrects_id
+    }
+
+# 辅助函数：原记录的更正流水（按追加顺序）
+def log_corrections(original):
+    return InventoryLog.query.filter_by(corrects_id=original.id).order_by(InventoryLog.id).all()
+
+# 辅助函数：原记录与其更正流水合并后的当前状态
+def net_log_state(original, corrections):
+    """
+    按 (操作类型, 空器具类型, 供应商) 合计数量，返回一个不入库的 InventoryLog 表示当前状态，
+    已删除（合计均为 0）时返回 None；备注取最后一条流水的备注
+    """
+    if not corrections:
+        return original
+    totals = {}
+    for entry in [original, *corrections]:
+        key = (entry.operation_code, entry.container_code, entry.supplier_id)
+        totals[key] = totals.get(key, 0) + entry.quantity
+    remaining = [(key, quantity) for key, quantity in totals.items() if quantity]
+    if not remaining:
+        return None
+    (operation_code, container_code, supplier_id), quantity = remaining[-1]
+    supplier = original.supplier if original.supplier_id == supplier_id else db.session.get(SupplierInfo, supplier_id)
+    return InventoryLog(
+        id=original.id,
+        timestamp=original.timestamp,
+        operation_code=operation_code,
+        container_code=container_code,
+        quantity=quantity,
+        supplier_id=supplier_id,
+        supplier=supplier,
+        operator=original.operator,
+        notes=corrections[-1].notes
+    )
+
+# 辅助函数：追加更正流水，把原记录的当前状态改为 target（None 表示删除），不提交
+def correct_inventory_log(original, current, target):
+    """
+    target 为 (操作类型编码, 空器具类型编码, 供应商, 数量, 备注)。操作类型、器具、供应商不变时只追加数量差额；
+    否则先冲销当前状态再补记新状态。返回追加的流水
+    """
+    current_key = (current.operation_code, current.container_code, current.supplier_id)
+    # 每项最后一个值为汇总表记录数的变化：冲销当前状态 -1，补记新状态 +1，同一键上调整数量不变
+    if target is None:
+        changes = [(current_key, current.supplier, -current.quantity, current.notes, -1)]
+    else:
+        operation_code, container_code, supplier, quantity, notes = target
+        target_key = (operation_code, container_code, supplier.id)
+        if target_key == current_key:
+            delta = quantity - current.quantity
+            changes = [(target_key, supplier, delta, notes, 0)] if delta or notes != current.notes else []
+        else:
+            changes = [(current_key, current.supplier, -current.quantity, notes, -1), (target_key, supplier, quantity, notes, 1)]
+    
+    entries = []
+    for (operation_code, container_code, _), supplier, quantity, notes, count in changes:
+        entry = InventoryLog(
+            timestamp=original.timestamp,
+            operation_code=operation_code,
+            container_code=container_code,
+            quantity=quantity,
+            supplier=supplier,
+            operator='系统管理员',
+            notes=notes,
+            corrects_id=original.id
+        )
+        db.session.add(entry)
+        db.session.flush()
+        update_rollup(entry, count=count)
+        record_change('inventory_log.corrected', entry.id, log_payload(entry))
+        entries.append(entry)
+    return entries
+
+# 辅助函数：将一条库存流水计入按日汇总表（sign=-1 为扣除），count 为记录数的变化（默认随 sign）
+def update_rollup(log, sign=1, count=None):
+    is_in = log.operation_code == OPERATION_TYPES['in']
+    stmt = sqlite_insert(InventoryRollup).values(
+        bucket_date=log.timestamp.date(),
+        supplier_id=log.supplier_id,
+        container_code=log.container_code,
+        in_qty=log.quantity * sign if is_in else 0,
+        out_qty=0 if is_in else log.quantity * sign,
+        log_count=sign if count is None else count
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['bucket_date', 'supplier_id', 'container_code'],
+        set_={
+            'in_qty': InventoryRollup.in_qty + stmt.excluded.in_qty,
+            'out_qty': InventoryRollup.out_qty + stmt.excluded.out_qty,
+            'log_count': InventoryRollup.log_count + stmt.excluded.log_count
+        }
+    )
+    db.session.execute(stmt)
+
+# 重建按日汇总表（历史数据回填 / 校正）
+def rebuild_rollups():
+    # 记录数按原记录计：原记录与其更正流水在某个键上合计不为 0 时计 1，已删除（冲销为 0）的不计
+    InventoryRollup.query.delete()
+    db.session.execute(db.text(
+        'INSERT INTO inventory_rollup (bucket_date, supplier_id, container_code, in_qty, out_qty, log_count) '
+        'SELECT bucket_date, supplier_id, container_code, SUM(in_qty), SUM(out_qty), '
+        'SUM(CASE WHEN in_qty != 0 OR out_qty != 0 THEN 1 ELSE 0 END) FROM ('
+        '  SELECT date(timestamp) AS bucket_date, supplier_id, container_code, '
+        '  SUM(CASE WHEN operation_code = :op_in THEN quantity ELSE 0 END) AS in_qty, '
+        '  SUM(CASE WHEN operation_code = :op_in THEN 0 ELSE quantity END) AS out_qty '
+        '  FROM inventory_log GROUP BY date(timestamp), supplier_id, container_code, coalesce(corrects_id, id)'
+        ') GROUP BY bucket_date, supplier_id, container_code'
+    ), {'op_in': OPERATION_TYPES['in']})
+    db.session.commit()
+    return InventoryRollup.query.count()
+
+# 库龄：增量刷新先进先出批次
+def refresh_aging():
+    """
+    只处理上次刷新后新增的流水（按ID顺序）：入库生成批次，出库从最早入库的批次开始冲减，
+    更正流水按数量正负视为入库或出库。
+    受影响键的批次与处理进度在同一事务中写回，返回处理的流水条数
+    """
+    lot_table = InventoryAgingLot.__table__
+    cursor_table = InventoryAgingCursor.__table__
+    with current_engine().connect() as conn:
+        last_log_id = conn.execute(db.select(cursor_table.c.last_log_id)).scalar() or 0
+        rows = conn.execute(db.select(
+            InventoryLog.id,
+            InventoryLog.timestamp,
+            InventoryLog.supplier_id,
+            InventoryLog.container_code,
+            InventoryLog.operation_code,
+            InventoryLog.quantity,
+            InventoryLog.corrects_id
+        ).where(InventoryLog.id > last_log_id).order_by(InventoryLog.id)).all()
+        if not rows:
+            return 0
+        
+        # 先推进进度（首个写操作即取得写锁），进度已被其他进程改动时放弃本次结果
+        now = datetime.utcnow()
+        claim = sqlite_insert(cursor_table).values(id=1, last_log_id=rows[-1].id, refreshed_at=now)
+        claim = claim.on_conflict_do_update(
+            index_elements=['id'],
+            set_={'last_log_id': claim.excluded.last_log_id, 'refreshed_at': claim.excluded.refreshed_at},
+            where=cursor_table.c.last_log_id == last_log_id
+        )
+        if not conn.execute(claim).rowcount:
+            conn.rollback()
+            return 0
+        
+        # 载入受影响键的剩余批次（按入库时间排序）及欠数
+        keys = {(row.supplier_id, row.container_code) for row in rows}
+        lots = {key: collections.deque() for key in keys}
+        deficits = {}
+        key_filter = db.tuple_(lot_table.c.supplier_id, lot_table.c.container_code).in_(keys)
+        if last_log_id:
+            existing = conn.execute(db.select(lot_table).where(key_filter).order_by(
+                lot_table.c.received_at, lot_table.c.log_id))
+            for lot in existing:
+                key = (lot.supplier_id, lot.container_code)
+                if lot.remaining < 0:
+                    deficits[key] = [-lot.remaining, lot.received_at, lot.log_id]
+                else:
+                    lots[key].append([lot.received_at, lot.log_id, lot.remaining])
+        
+        for log_id, timestamp, supplier_id, container_code, operation_code, quantity, corrects_id in rows:
+            key = (supplier_id, container_code)
+            queue = lots[key]
+            is_in = operation_code == OPERATION_TYPES['in']
+            if is_in == (quantity >= 0):
+                # 入库，或冲减出库的更正流水（负数出库，空器具按原出库时间回到库中）
+                quantity = abs(quantity)
+                deficit = deficits.get(key)
+                if deficit:
+                    offset = min(deficit[0], quantity)
+                    deficit[0] -= offset
+                    quantity -= offset
+                    if not deficit[0]:
+                        del deficits[key]
+                if quantity > 0:
+                    lot = [timestamp, log_id, quantity]
+                    if queue and lot < queue[-1]:
+                        queue.insert(bisect.bisect(queue, lot), lot)  # 补录的历史入库
+                    else:
+                        queue.append(lot)
+            else:
+                quantity = abs(quantity)
+                # 冲减入库的更正流水先扣原入库生成的批次
+                if is_in and corrects_id:
+                    for index, lot in enumerate(queue):
+                        if lot[1] == corrects_id:
+                            taken = min(lot[2], quantity)
+                            lot[2] -= taken
+                            quantity -= taken
+                            if not lot[2]:
+                                del queue[index]
+                            break
+                while quantity > 0 and queue:
+                    taken = min(queue[0][2], quantity)
+                    queue[0][2] -= taken
+                    quantity -= taken
+                    if not queue[0][2]:
+                        queue.popleft()
+                if quantity > 0:
+                    deficit = deficits.setdefault(key, [0, timestamp, log_id])
+                    deficit[0] += quantity
+        
+        conn.execute(lot_table.delete().where(key_filter) if last_log_id else lot_table.delete())
+        new_lots = [
+            {'supplier_id': key[0], 'container_code': key[1], 'received_at': lot[0], 'log_id': lot[1], 'remaining': lot[2]}
+            for key, queue in lots.items() for lot in queue
+        ] + [
+            {'supplier_id': key[0], 'container_code': key[1], 'received_at': deficit[1], 'log_id': deficit[2], 'remaining': -deficit[0]}
+            for key, deficit in deficits.items()
+        ]
+        if new_lots:
+            conn.execute(lot_table.insert(), new_lots)
+        conn.commit()
+    return len(rows)
+
+# 库存页面调用：同一仓库每隔 AGING_REFRESH_INTERVAL 秒最多刷新一次
+_aging_refreshed = {}
+
+def refresh_aging_if_due():
+    site = current_site()
+    if time.monotonic() - _aging_refreshed.get(site, float('-inf')) < app.config['AGING_REFRESH_INTERVAL']:
+        return
+    try:
+        refresh_aging()
+        _aging_refreshed[site] = time.monotonic()
+    except Exception as e:
+        app.logger.error(f"刷新库龄错误: {str(e)}")
+
+# 流水被物理删除（清理）后批次不再可信，清空后下次刷新从头重算（与删除在同一事务中）
+def invalidate_aging():
+    InventoryAgingLot.query.delete()
+    InventoryAgingCursor.query.update({'last_log_id': 0})
+    _aging_refreshed.pop(current_site(), None)
+
+def aging_bucket_labels():
+    days = app.config['AGING_BUCKET_DAYS']
+    labels = [f'{days[0]}天内']
+    labels += [f'{low + 1}-{high}天' for low, high in zip(days, days[1:])]
+    labels.append(f'{days[-1]}天以上')
+    return labels
+
+def empty_aging():
+    return {
+        'aging_buckets': [0] * (len(app.config['AGING_BUCKET_DAYS']) + 1),
+        'avg_age_days': 0,
+        'max_age_days': 0,
+        'stock_days': 0
+    }
+
+# 辅助函数：按 (供应商, 空器具类型) 汇总剩余批次的库龄
+def query_aging_summary():
+    """
+    返回 {(supplier_id, container_code): {aging_buckets, avg_age_days, max_age_days, stock_days}}，
+    库龄按当前时间计算，aging_buckets 为各库龄段的剩余数量
+    """
+    # 库龄分段换算为入库时间的分界点，直接比较入库时间列；滞留量 = 数量 × 当前儒略日 - Σ(数量 × 入库儒略日)
+    now = datetime.utcnow()
+    now_julian = (now - datetime(1970, 1, 1)).total_seconds() / 86400 + 2440587.5
+    cutoffs = [now - timedelta(days=days) for days in app.config['AGING_BUCKET_DAYS']]
+    received_at = InventoryAgingLot.received_at
+    remaining = InventoryAgingLot.remaining
+    buckets = [db.func.sum(db.case((received_at >= cutoffs[0], remaining), else_=0))]
+    buckets += [
+        db.func.sum(db.case(((received_at < newer) & (received_at >= older), remaining), else_=0))
+        for newer, older in zip(cutoffs, cutoffs[1:])
+    ]
+    buckets.append(db.func.sum(db.case((received_at < cutoffs[-1], remaining), else_=0)))
+    rows = db.session.query(
+        InventoryAgingLot.supplier_id,
+        InventoryAgingLot.container_code,
+        db.func.sum(remaining),
+        db.func.sum(remaining * db.func.julianday(received_at)),
+        db.func.min(received_at),
+        *buckets
+    ).filter(remaining > 0).group_by(
+        InventoryAgingLot.supplier_id,
+        InventoryAgingLot.container_code
+    ).all()
+    
+    summary = {}
+    for supplier_id, container_code, quantity, weighted_julian, oldest, *bucket_quantities in rows:
+        stock_days = quantity * now_julian - weighted_julian
+        summary[(supplier_id, container_code)] = {
+            'aging_buckets': bucket_quantities,
+            'avg_age_days': round(stock_days / quantity, 1),
+            'max_age_days': round((now - oldest).total_seconds() / 86400, 1),
+            'stock_days': round(stock_days)
+        }
+    return summary
+
+# 辅助函数：按条件筛选供应商ID（文本匹配只在供应商表上进行）
+def filter_supplier_ids(carrier=None, supplier=None):
+    query = db.session.query(SupplierInfo.id)
+    if carrier:
+        query = query.join(Carrier).filter(Carrier.name == carrier)
+    if supplier:
+        query = query.filter(
+            (SupplierInfo.supplier_code.contains(supplier)) |
+            (SupplierInfo.mfg_code.contains(supplier)) |
+            (SupplierInfo.supplier_name.contains(supplier))
+        )
+    return query
+
+# 辅助函数：按 (供应商, 空器具类型) 汇总当前库存
+def query_inventory_balances(carrier=None, supplier=None, container_type=None):
+    """
+    在整数键上分组聚合库存流水，再关联供应商表取展示字段，只返回库存大于0的记录
+    """
+    query = db.session.query(
+        InventoryLog.supplier_id,
+        InventoryLog.container_code,
+        db.func.sum(signed_quantity()).label('current_stock')
+    ).group_by(
+        InventoryLog.supplier_id,
+        InventoryLog.container_code
+    )
+    
+    if carrier or supplier:
+        query = query.filter(InventoryLog.supplier_id.in_(filter_supplier_ids(carrier, supplier)))
+    if container_type:
+        query = query.filter(InventoryLog.container_code == CONTAINER_CODES.get(container_type))
+    
+    rows = [row for row in query.all() if row.current_stock > 0]
+    suppliers = {}
+    if rows:
+        supplier_ids = {row.supplier_id for row in rows}
+        suppliers = {s.id: s for s in SupplierInfo.query.filter(SupplierInfo.id.in_(supplier_ids))}
+    
+    results = []
+    for row in rows:
+        supplier_info = suppliers[row.supplier_id]
+        results.append({
+            'supplier_id': row.supplier_id,
+            'container_code': row.container_code,
+            'supplier_code': supplier_info.supplier_code,
+            'mfg_code': supplier_info.mfg_code,
+            'supplier_name': supplier_info.supplier_name,
+            'carrier': supplier_info.carrier,
+            'container_type': container_name(row.container_code),
+            'current_stock': row.current_stock
+        })
+    results.sort(key=lambda x: (x['supplier_code'], x['mfg_code'], x['carrier'], x['container_type']))
+    return results
+
+# 区域汇总查询线程池（首次使用时创建，避免 fork 前创建线程）
+_region_executor = None
+_region_executor_lock = threading.Lock()
+
+def region_executor():
+    global _region_executor
+    with _region_executor_lock:
+        if _region_executor is None:
+            _region_executor = ThreadPoolExecutor(
+                max_workers=app.config['REGION_QUERY_WORKERS'],
+                thread_name_prefix='region-query'
+            )
+    return _region_executor
+
+def collect_site_inventory(site, filters):
+    with site_context(site):
+        g.reporting = True
+        return query_inventory_balances(**filters)
+
+# 辅助函数：根据筛选参数构建出入库记录查询
+def build_inventory_log_query(args):
+    operation_type = args.get('operation_type')
+    container_type = args.get('container_type')
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
+    supplier = args.get('supplier')
+    
+    query = InventoryLog.query
+    
+    if operation_type:
+        query = query.filter(InventoryLog.operation_code == OPERATION_TYPES.get(operation_type))
+    if container_type:
+        query = query.filter(InventoryLog.container_code == CONTAINER_CODES.get(container_type))
+    if date_from:
+        query = query.filter(InventoryLog.timestamp >= datetime.strptime(date_from, '%Y-%m-%d'))
+    if date_to:
+        end_date = datetime.strptime(date_to, '%Y-%m-%d')
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+        query = query.filter(InventoryLog.timestamp <= end_date)
+    if supplier:
+        query = query.filter(InventoryLog.supplier_id.in_(filter_supplier_ids(supplier=supplier)))
+    
+    return query
+
+# 库存流水回放：按业务时间重放每个 (供应商, 空器具类型) 的库存变化，找出历史上出现过的负库存
+def replay_ledger():
+    """
+    分块读取库存流水到 NumPy 数组，一次排序、分组累加得到当前库存、最低库存和首次转负的记录，
+    并与按日汇总表、库龄批次的结存对比。更正流水与原记录视为一次变化，只按合并后的结果判断负库存。
+    返回每个键一行的 DataFrame
+    """
+    stmt = db.select(
+        InventoryLog.supplier_id,
+        InventoryLog.container_code,
+        db.func.julianday(InventoryLog.timestamp),
+        InventoryLog.id,
+        signed_quantity(),
+        db.func.coalesce(InventoryLog.corrects_id, InventoryLog.id)
+    )
+    # 直接用 DBAPI 游标分块读取元组，避免逐行构造 Row 对象（百万行时相差一个数量级）
+    connection = db.session.connection()
+    cursor = connection.connection.cursor()
+    cursor.execute(str(stmt.compile(connection, compile_kwargs={'literal_binds': True})))
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(app.config['LEDGER_REPLAY_CHUNK'])
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+    cursor.close()
+    data = np.concatenate(chunks) if chunks else np.empty((0, 6))
+    supplier_ids = data[:, 0].astype(np.int64)
+    container_codes = data[:, 1].astype(np.int64)
+    times = data[:, 2]
+    log_ids = data[:, 3].astype(np.int64)
+    quantities = data[:, 4].astype(np.int64)
+    root_ids = data[:, 5].astype(np.int64)
+    
+    # 按 (供应商, 器具, 时间, 原记录ID, ID) 排序，同一时间的记录按登记先后，更正流水紧跟在原记录之后
+    order = np.lexsort((log_ids, root_ids, times, container_codes, supplier_ids))
+    supplier_ids, container_codes, times, log_ids, quantities, root_ids = (
+        supplier_ids[order], container_codes[order], times[order], log_ids[order], quantities[order], root_ids[order])
+    
+    # 分组累加：全局累计和减去各组起点之前的累计和
+    boundary = np.ones(len(order), dtype=bool)
+    boundary[1:] = (supplier_ids[1:] != supplier_ids[:-1]) | (container_codes[1:] != container_codes[:-1])
+    starts = np.flatnonzero(boundary)
+    counts = np.diff(np.append(starts, len(order)))
+    group = np.repeat(np.arange(len(starts)), counts)
+    running = np.cumsum(quantities)
+    balances = running - (running[starts] - quantities[starts])[group]
+    
+    # 原记录及其更正流水中只有最后一条之后的余额是实际出现过的库存（如冲销后补记不算转负）
+    observable = np.ones(len(order), dtype=bool)
+    observable[:-1] = boundary[1:] | (root_ids[1:] != root_ids[:-1])
+    
+    # 每组第一次出现负库存的位置
+    negative_rows = np.flatnonzero((balances < 0) & observable)
+    negative_groups, first = np.unique(group[negative_rows], return_index=True)
+    first_rows = negative_rows[first]
+    first_negative_id = np.zeros(len(starts), dtype=np.int64)
+    first_negative_time = np.full(len(starts), np.nan)
+    first_negative_balance = np.zeros(len(starts), dtype=np.int64)
+    first_negative_id[negative_groups] = root_ids[first_rows]
+    first_negative_time[negative_groups] = times[first_rows]
+    first_negative_balance[negative_groups] = balances[first_rows]
+    
+    report = pd.DataFrame({
+        'supplier_id': supplier_ids[starts],
+        'container_code': container_codes[starts],
+        'movements': counts,
+        'current_balance': balances[starts + counts - 1] if len(starts) else np.empty(0, dtype=np.int64),
+        'min_balance': np.minimum.reduceat(np.where(observable, balances, np.iinfo(np.int64).max), starts) if len(starts) else np.empty(0, dtype=np.int64),
+        'negative_movements': np.bincount(group[negative_rows], minlength=len(starts)),
+        'first_negative_log_id': first_negative_id,
+        'first_negative_time': pd.to_datetime(first_negative_time - 2440587.5, unit='D').round('s'),
+        'first_negative_balance': first_negative_balance
+    })
+    
+    # 与独立维护、可能偏离流水的派生数据对比：按日汇总表始终参与，库龄批次在已处理到最新流水时参与
+    rollup = pd.DataFrame(db.session.query(
+        InventoryRollup.supplier_id,
+        InventoryRollup.container_code,
+        db.func.sum(InventoryRollup.in_qty - InventoryRollup.out_qty)
+    ).group_by(InventoryRollup.supplier_id, InventoryRollup.container_code).all(),
+        columns=['supplier_id', 'container_code', 'rollup_stock'])
+    report = report.merge(rollup, on=['supplier_id', 'container_code'], how='outer')
+    cursor_row = db.session.get(InventoryAgingCursor, 1)
+    max_log_id = db.session.query(db.func.max(InventoryLog.id)).scalar() or 0
+    aging_current = cursor_row is not None and cursor_row.last_log_id >= max_log_id
+    if aging_current:
+        aging = pd.DataFrame(db.session.query(
+            InventoryAgingLot.supplier_id,
+            InventoryAgingLot.container_code,
+            db.func.sum(InventoryAgingLot.remaining)
+        ).group_by(InventoryAgingLot.supplier_id, InventoryAgingLot.container_code).all(),
+            columns=['supplier_id', 'container_code', 'aging_stock'])
+        report = report.merge(aging, on=['supplier_id', 'container_code'], how='outer')
+    
+    # 只在派生数据中出现的键没有流水，回放结果按 0 计
+    for column in ['movements', 'current_balance', 'min_balance', 'negative_movements',
+                   'first_negative_log_id', 'first_negative_balance', 'rollup_stock']:
+        report[column] = report[column].fillna(0).astype(np.int64)
+    report['mismatch'] = report['rollup_stock'] != report['current_balance']
+    if aging_current:
+        report['aging_stock'] = report['aging_stock'].fillna(0).astype(np.int64)
+        report['mismatch'] |= report['aging_stock'] != report['current_balance']
+    else:
+        report['aging_stock'] = pd.Series(pd.NA, index=report.index, dtype='Int64')
+    
+    suppliers = {s.id: s for s in SupplierInfo.query}
+    report['supplier_code'] = [suppliers[i].supplier_code if i in suppliers else '' for i in report['supplier_id']]
+    report['mfg_code'] = [suppliers[i].mfg_code if i in suppliers else '' for i in report['supplier_id']]
+    report['supplier_name'] = [suppliers[i].supplier_name if i in suppliers else '' for i in report['supplier_id']]
+    report['container_type'] = [container_name(code) for code in report['container_code']]
+    return report
+
+# 回放结果中需要关注的键：历史上出现过负库存，或与汇总表、库龄批次不一致
+def ledger_anomalies(report):
+    anomalies = report[(report['min_balance'] < 0) | report['mismatch']]
+    return anomalies.sort_values(['min_balance', 'mfg_code', 'container_type'])
+
+# 历史流水导入：各字段可用的表头（与出入库记录导出的列名一致，另兼容旧表格的常见写法）
+IMPORT_COLUMNS = {
+    'timestamp': ['时间', '日期', '操作时间'],
+    'operation_type': ['操作类型'],
+    'container_type': ['空器具类型', '器具类型'],
+    'quantity': ['数量'],
+    'mfg_code': ['发货地代码', 'MFG代码'],
+    'operator': ['操作员'],
+    'notes': ['备注']
+}
+IMPORT_REQUIRED = ['timestamp', 'operation_type', 'container_type', 'quantity', 'mfg_code']
+IMPORT_OPERATIONS = {'入库': 'in', '出库': 'out', 'in': 'in', 'out': 'out'}
+IMPORT_TIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+# 逐行读取 .xlsx / .csv 的第一个工作表（只读流式，不整表载入内存），第一行为表头
+def iter_spreadsheet_rows(path):
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
+        return
+    
+    # Excel 另存的 CSV 常为 GBK 编码，开头不是合法 UTF-8 时按 GB18030 读取
+    with open(path, 'rb') as f:
+        sample = f.read(65536)
+    encoding = 'utf-8-sig'
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:
+            encoding = 'gb18030'
+    with open(path, encoding=encoding, newline='') as f:
+        yield from csv.reader(f)
+
+# 辅助函数：解析导入文件中的时间（Excel 日期单元格或文本），无法识别时返回 None
+def parse_import_time(value):
+    if isinstance(value, datetime):
+        return value
+    text = str(value if value is not None else '').strip().replace('/', '-')
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in IMPORT_TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+# 辅助函数：校验导入文件的一行，返回 (待写入的字段, None) 或 (None, 拒绝原因)
+def parse_import_row(values, columns, suppliers, operator, utc_offset, latest):
+    raw = {field: values[index] if index < len(values) else None for field, index in columns.items()}
+    
+    timestamp = parse_import_time(raw['timestamp'])
+    if timestamp is None:
+        return None, f'无法识别的时间: {raw["timestamp"]}'
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        timestamp -= utc_offset
+    if timestamp > latest:
+        return None, '时间晚于当前时间'
+    
+    operation_type = IMPORT_OPERATIONS.get(str(raw['operation_type'] or '').strip().lower())
+    if operation_type is None:
+        return None, f'无效的操作类型: {raw["operation_type"]}'
+    container_code = CONTAINER_CODES.get(str(raw['container_type'] or '').strip())
+    if container_code is None:
+        return None, f'无效的空器具类型: {raw["container_type"]}'
+    
+    try:
+        quantity = float(raw['quantity'])
+    except (TypeError, ValueError):
+        return None, f'数量必须是有效数字: {raw["quantity"]}'
+    if not math.isfinite(quantity):
+        return None, f'数量必须是有效数字: {raw["quantity"]}'
+    if quantity <= 0 or quantity != int(quantity):
+        return None, f'数量必须是正整数: {raw["quantity"]}'
+    if quantity >= 2 ** 31:
+        return None, f'数量超出范围: {raw["quantity"]}'
+    
+    mfg_code = str(raw['mfg_code'] or '').strip()
+    supplier_id = suppliers.get(mfg_code)
+    if supplier_id is None:
+        return None, f'未找到发货地代码: {mfg_code}'
+    
+    notes = raw.get('notes')
+    return {
+        'timestamp': timestamp,
+        'supplier_id': supplier_id,
+        'operation_code': OPERATION_TYPES[operation_type],
+        'container_code': container_code,
+        'quantity': int(quantity),
+        'operator': str(raw.get('operator') or '').strip()[:50] or operator,
+        'notes': str(notes).strip() if notes not in (None, '') else None
+    }, None
+
+# 历史流水批量导入
+def import_inventory_logs(path, rejected_path, operator='历史导入', utc_offset=timedelta(0), dry_run=False, force=False, progress=None):
+    """
+    流式读取文件，按发货地代码一次性载入的字典解析供应商，每 IMPORT_BATCH_SIZE 行一个事务写入，
+    保留原始业务时间。不做库存校验（导入后可用 replay-ledger 检查历史负库存）。
+    每行流水写入一条 inventory_log.created 变更事件，导入进度记录在 LedgerImport 中并随每批提交：
+    上次中断的文件再次导入时从已提交的行之后继续，已完成的文件默认不重复导入。
+    无法导入的行连同行号、原因写入 rejected_path（CSV，改正后可直接再次导入）。
+    结束或中断时重建按日汇总表和库龄批次。返回导入统计
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    sha1 = digest.hexdigest()
+    previous = LedgerImport.query.filter_by(sha1=sha1).order_by(LedgerImport.id.desc()).first()
+    resume = previous if not dry_run and previous is not None and previous.finished_at is None else None
+    if not dry_run and previous is not None:
+        if resume and force:
+            raise ValueError(f'该文件上次导入未完成（已写入至第 {resume.last_line} 行），请不带 --force 再次执行以继续导入')
+        if not resume and not force:
+            raise ValueError('该文件已导入过，确需重复导入时请使用 --force')
+    
+    rows = iter_spreadsheet_rows(path)
+    header = [str(name).strip() if name is not None else '' for name in next(rows, [])]
+    columns = {}
+    for field, names in IMPORT_COLUMNS.items():
+        for name in names:
+            if name in header:
+                columns[field] = header.index(name)
+                break
+    missing = [IMPORT_COLUMNS[field][0] for field in IMPORT_REQUIRED if field not in columns]
+    if missing:
+        raise ValueError(f'文件缺少必需的列: {"、".join(missing)}')
+    
+    # 变更事件中的供应商字段与 log_payload 一致
+    supplier_rows = db.session.query(
+        SupplierInfo.id, SupplierInfo.mfg_code, SupplierInfo.supplier_code, SupplierInfo.supplier_name, Carrier.name
+    ).outerjoin(Carrier, SupplierInfo.carrier_id == Carrier.id).all()
+    suppliers = {row.mfg_code: row.id for row in supplier_rows}
+    supplier_fields = {
+        row.id: {'supplier_code': row.supplier_code, 'mfg_code': row.mfg_code,
+                 'supplier_name': row.supplier_name, 'carrier': row.name}
+        for row in supplier_rows
+    }
+    latest = datetime.utcnow() + timedelta(minutes=5)
+    log_table = InventoryLog.__table__
+    event_table = ChangeEvent.__table__
+    import_table = LedgerImport.__table__
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    skip_through = resume.last_line if resume else 0
+    summary = {'rows': 0, 'imported': 0, 'rejected': 0, 'unknown_mfg_codes': collections.Counter(), 'sha1': sha1,
+               'resumed_from': skip_through, 'previously_imported': resume.imported_rows if resume else 0}
+    
+    import_id = resume.id if resume else None
+    if not dry_run and import_id is None:
+        record = LedgerImport(sha1=sha1, source=os.path.basename(path))
+        db.session.add(record)
+        db.session.commit()
+        import_id = record.id
+    
+    def write_batch(batch, last_line, finished=False):
+        recorded_at = datetime.utcnow()
+        for entry in batch:
+            entry['recorded_at'] = recorded_at
+        with current_engine().begin() as conn:
+            if batch:
+                conn.execute(log_table.insert(), batch)
+                # 同一事务内写入的流水ID连续，按顺序对应本批各行
+                first_id = conn.execute(db.select(db.func.max(log_table.c.id))).scalar() - len(batch) + 1
+                conn.execute(event_table.insert(), [{
+                    'created_at': recorded_at,
+                    'event_type': 'inventory_log.created',
+                    'entity_id': first_id + offset,
+                    'payload': json.dumps({
+                        'id': first_id + offset,
+                        'timestamp': entry['timestamp'].isoformat(),
+                        'operation_type': OPERATION_NAMES[entry['operation_code']],
+                        'container_type': container_name(entry['container_code']),
+                        'quantity': entry['quantity'],
+                        **supplier_fields[entry['supplier_id']],
+                        'operator': entry['operator'],
+                        'notes': entry['notes'],
+                        'corrects_id': None
+                    }, ensure_ascii=False, separators=(',', ':'))
+                } for offset, entry in enumerate(batch)])
+            conn.execute(import_table.update().where(import_table.c.id == import_id).values(
+                last_line=last_line,
+                imported_rows=import_table.c.imported_rows + len(batch),
+                finished_at=recorded_at if finished else None
+            ))
+    
+    written = bool(resume)  # 上次中断时可能未重建汇总表
+    finished = False
+    try:
+        with open(rejected_path, 'w', encoding='utf-8-sig', newline='') as rejected_file:
+            rejected = csv.writer(rejected_file)
+            rejected.writerow(['行号', '拒绝原因'] + header)
+            batch = []
+            line_number = 1
+            for line_number, values in enumerate(rows, start=2):
+                if not any(value not in (None, '') for value in values):
+                    continue
+                summary['rows'] += 1
+                entry, error = parse_import_row(values, columns, suppliers, operator, utc_offset, latest)
+                if error:
+                    summary['rejected'] += 1
+                    if error.startswith('未找到发货地代码'):
+                        summary['unknown_mfg_codes'][error.split(': ', 1)[1]] += 1
+                    rejected.writerow([line_number, error] + ['' if value is None else value for value in values])
+                    continue
+                # 继续导入时已写入的行只校验（保持拒绝报告完整），不再写入
+                if line_number <= skip_through:
+                    continue
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    if not dry_run:
+                        write_batch(batch, line_number)
+                        written = True
+                    summary['imported'] += len(batch)
+                    batch = []
+                    if progress:
+                        progress(summary)
+            if not dry_run:
+                write_batch(batch, line_number, finished=True)
+                written = written or bool(batch)
+            summary['imported'] += len(batch)
+        finished = True
+    finally:
+        if written and not dry_run:
+            try:
+                rebuild_after_import()
+            except Exception:
+                # 导入本身已出错时不掩盖原异常，汇总表可稍后用 backfill-rollups、refresh-aging --rebuild 重建
+                if finished:
+                    raise
+                app.logger.exception('导入中断后重建汇总表、库龄批次失败')
+    return summary
+
+# 辅助函数：导入的流水时间早于已有流水，汇总表、库龄批次从头重算一次
+def rebuild_after_import():
+    db.session.rollback()
+    rebuild_rollups()
+    invalidate_aging()
+    db.session.commit()
+    refresh_aging()
+    invalidate_stats()
+
 # 初始化供应商数据
 def init_supplier_data():
     # 添加一些示例数据
@@ -1031,8 +2720,230 @@ def init_supplier_data():
         
         db.session.commit()
 
+# 旧版数据库结构迁移：库存流水由文本列改为供应商外键 + 小整数编码
+def migrate_legacy_schema():
+    """
+    检测旧版 supplier_info（文本承运商）和 inventory_log（重复存储供应商文本）表，
+    在同一事务内重建为编码结构并拷贝数据，返回是否执行了迁移
+    """
+    engine = current_engine()
+    inspector = db.inspect(engine)
+    tables = inspector.get_table_names()
+    legacy_supplier = 'supplier_info' in tables and 'carrier_id' not in {
+        c['name'] for c in inspector.get_columns('supplier_info')}
+    legacy_log = 'inventory_log' in tables and 'supplier_id' not in {
+        c['name'] for c in inspector.get_columns('inventory_log')}
+    if not (legacy_supplier or legacy_log):
+        return False
+    
+    app.logger.info('检测到旧版数据库结构，开始迁移')
+    operation_case = ' '.join(f"WHEN '{name}' THEN {code}" for name, code in OPERATION_TYPES.items())
+    container_case = ' '.join(f"WHEN '{name}' THEN {code}" for name, code in CONTAINER_CODES.items())
+    
+    with engine.begin() as conn:
+        # 无法映射为编码的旧值在改动任何表之前报错
+        if legacy_log:
+            for column, names, label in (('container_type', CONTAINER_TYPES, '空器具类型'),
+                                          ('operation_type', list(OPERATION_TYPES), '操作类型')):
+                unknown = conn.exec_driver_sql(
+                    f'SELECT DISTINCT {column} FROM inventory_log WHERE {column} IS NULL OR {column} NOT IN (%s)'
+                    % ','.join('?' * len(names)), tuple(names)
+                ).scalars().all()
+                if unknown:
+                    raise RuntimeError(f'库存记录中存在未知的{label}: {unknown}')
+        
+        # pysqlite 不会为 DDL 自动开启事务，显式开启，使重命名、建表与数据拷贝一起提交或回滚
+        conn.exec_driver_sql('BEGIN')
+        # 旧式重命名：其他表中引用 supplier_info / inventory_log 的外键保持原表名，
+        # 不随重命名改指向随后删除的 *_legacy 表
+        conn.exec_driver_sql('PRAGMA legacy_alter_table=ON')
+        if legacy_supplier:
+            conn.exec_driver_sql('ALTER TABLE supplier_info RENAME TO supplier_info_legacy')
+        if legacy_log:
+            conn.exec_driver_sql('ALTER TABLE inventory_log RENAME TO inventory_log_legacy')
+        conn.exec_driver_sql('PRAGMA legacy_alter_table=OFF')
+        db.metadata.create_all(conn)
+        
+        # 承运商字典：预置列表 + 历史数据中出现过的承运商
+        for name in CARRIERS:
+            conn.exec_driver_sql('INSERT OR IGNORE INTO carrier (name) VALUES (?)', (name,))
+        if legacy_supplier:
+            conn.exec_driver_sql('INSERT OR IGNORE INTO carrier (name) SELECT DISTINCT carrier FROM supplier_info_legacy')
+            conn.exec_driver_sql(
+                'INSERT INTO supplier_info (id, supplier_code, mfg_code, supplier_name, carrier_id, created_at, updated_at) '
+                'SELECT s.id, s.supplier_code, s.mfg_code, s.supplier_name, c.id, s.created_at, s.updated_at '
+                'FROM supplier_info_legacy s JOIN carrier c ON c.name = s.carrier'
+            )
+            conn.exec_driver_sql('DROP TABLE supplier_info_legacy')
+        
+        if legacy_log:
+            # 发货地代码已被修改或删除的历史记录，按记录中的供应商文本补建供应商
+            conn.exec_driver_sql('INSERT OR IGNORE INTO carrier (name) SELECT DISTINCT carrier FROM inventory_log_legacy')
+            conn.exec_driver_sql(
+                'INSERT INTO supplier_info (supplier_code, mfg_code, supplier_name, carrier_id, created_at, updated_at) '
+                'SELECT l.supplier_code, l.mfg_code, l.supplier_name, c.id, MIN(l.timestamp), MAX(l.timestamp) '
+                'FROM inventory_log_legacy l JOIN carrier c ON c.name = l.carrier '
+                'WHERE l.mfg_code NOT IN (SELECT mfg_code FROM supplier_info) GROUP BY l.mfg_code'
+            )
+            conn.exec_driver_sql(
+                'INSERT INTO inventory_log (id, timestamp, supplier_id, operation_code, container_code, quantity, operator, notes) '
+                f'SELECT l.id, l.timestamp, s.id, CASE l.operation_type {operation_case} END, '
+                f'CASE l.container_type {container_case} END, l.quantity, l.operator, l.notes '
+                'FROM inventory_log_legacy l JOIN supplier_info s ON s.mfg_code = l.mfg_code'
+            )
+            conn.exec_driver_sql('DROP TABLE inventory_log_legacy')
+    
+    # 回收旧表占用的空间（VACUUM 不能在事务中执行）
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('VACUUM')
+    
+    app.logger.info('数据库结构迁移完成')
+    return True
+
+# 修复早期迁移留下的外键：先建表后迁移时，SQLite 重命名旧表会把其他表的外键改指向
+# 随后删除的 *_legacy 表。按当前模型重建这些表（建新表、拷贝数据、删除旧表）
+def repair_legacy_references():
+    engine = current_engine()
+    with engine.begin() as conn:
+        broken = [name for name, sql in conn.exec_driver_sql("SELECT name, sql FROM sqlite_master WHERE type = 'table'")
+                  if '_legacy"' in (sql or '') and name in db.metadata.tables]
+        if not broken:
+            return []
+        conn.exec_driver_sql('PRAGMA legacy_alter_table=ON')
+        for name in broken:
+            table = db.metadata.tables[name]
+            existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{name}")')}
+            conn.exec_driver_sql(f'ALTER TABLE "{name}" RENAME TO "{name}_broken"')
+            # 索引随表改名但名称不变，先删除以免与新表的索引重名
+            for index in conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                    (f'{name}_broken',)).scalars().all():
+                conn.exec_driver_sql(f'DROP INDEX "{index}"')
+            table.create(conn)
+            columns = ', '.join(f'"{column.name}"' for column in table.columns if column.name in existing)
+            conn.exec_driver_sql(f'INSERT INTO "{name}" ({columns}) SELECT {columns} FROM "{name}_broken"')
+            conn.exec_driver_sql(f'DROP TABLE "{name}_broken"')
+        conn.exec_driver_sql('PRAGMA legacy_alter_table=OFF')
+    app.logger.info(f'已修复引用旧表的外键: {", ".join(broken)}')
+    return broken
+
+# 为已有数据库补充后来新增的列（SQLite 只能逐列 ADD COLUMN）
+def migrate_added_columns():
+    engine = current_engine()
+    columns = {c['name'] for c in db.inspect(engine).get_columns('inventory_log')}
+    with engine.begin() as conn:
+        if 'corrects_id' not in columns:
+            conn.exec_driver_sql('ALTER TABLE inventory_log ADD COLUMN corrects_id INTEGER REFERENCES inventory_log (id)')
+        if 'recorded_at' not in columns:
+            conn.exec_driver_sql('ALTER TABLE inventory_log ADD COLUMN recorded_at DATETIME')
+        conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_inventory_log_corrects_id ON inventory_log (corrects_id)')
+
+# 初始化数据库：建表、迁移旧结构、写入基础数据
+def init_database():
+    # 先迁移旧结构再建其他表，避免重命名旧表时新表的外键被改指向旧表
+    migrate_legacy_schema()
+    db.metadata.create_all(current_engine())
+    repair_legacy_references()
+    migrate_added_columns()
+    for name in CARRIERS:
+        get_carrier(name)
+    db.session.commit()
+    init_supplier_data()
+    # 汇总表为空而已有流水时（升级后首次启动）回填
+    if InventoryRollup.query.first() is None and InventoryLog.query.first() is not None:
+        rebuild_rollups()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """初始化数据库并迁移旧版结构（多仓库模式下逐个仓库执行）"""
+    for site in app.config['SITES'] or [None]:
+        with site_context(site):
+            init_database()
+        print(f'数据库初始化完成: {site or "默认"}')
+
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    """根据库存流水重建按日汇总表"""
+    for site in app.config['SITES'] or [None]:
+        with site_context(site):
+            count = rebuild_rollups()
+        print(f'{site or "默认"}: 已生成 {count} 条日汇总记录')
+
+@app.cli.command('replay-ledger')
+@click.option('--csv', 'csv_path', help='将全部回放结果写入 CSV 文件')
+def replay_ledger_command(csv_path):
+    """回放库存流水，列出历史上出现过负库存或与汇总表、库龄批次不一致的记录"""
+    for site in app.config['SITES'] or [None]:
+        with site_context(site):
+            g.reporting = True
+            start = time.perf_counter()
+            report = replay_ledger()
+            elapsed = time.perf_counter() - start
+            anomalies = ledger_anomalies(report)
+        print(f'{site or "默认"}: 回放 {report["movements"].sum()} 条流水、{len(report)} 个键，'
+              f'耗时 {elapsed:.2f} 秒，{int((report["min_balance"] < 0).sum())} 个键出现过负库存，'
+              f'{int(report["mismatch"].sum())} 个键与汇总表、库龄批次不一致')
+        for row in anomalies.itertuples():
+            line = f'  {row.mfg_code} {row.container_type}: 当前 {row.current_balance}，最低 {row.min_balance}'
+            if row.first_negative_log_id:
+                line += f'，首次为负 {row.first_negative_time} (记录 {row.first_negative_log_id})'
+            if row.mismatch:
+                line += f'，汇总表 {row.rollup_stock}' + ('' if pd.isna(row.aging_stock) else f'，库龄批次 {row.aging_stock}')
+            print(line)
+        if csv_path:
+            path = csv_path if not site else f'{os.path.splitext(csv_path)[0]}_{site}.csv'
+            report.to_csv(path, index=False, encoding='utf-8-sig')
+            print(f'  已写入 {path}')
+
+@app.cli.command('refresh-aging')
+@click.option('--rebuild', is_flag=True, help='清空批次后从头重算')
+def refresh_aging_command(rebuild):
+    """增量刷新空器具库龄批次（可由定时任务每隔几分钟执行）"""
+    for site in app.config['SITES'] or [None]:
+        with site_context(site):
+            if rebuild:
+                invalidate_aging()
+                db.session.commit()
+            start = time.perf_counter()
+            count = refresh_aging()
+        print(f'{site or "默认"}: 处理 {count} 条新流水，耗时 {time.perf_counter() - start:.2f} 秒')
+
+@app.cli.command('import-ledger')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--site', help='导入到指定仓库（多仓库模式必填）')
+@click.option('--rejected', 'rejected_path', help='无法导入的行写入该 CSV 文件（默认为 <文件名>_rejected.csv）')
+@click.option('--operator', default='历史导入', show_default=True, help='文件中没有操作员列时使用的操作员')
+@click.option('--utc-offset', default=0.0, show_default=True, help='文件中的时间相对 UTC 的小时数（如北京时间为 8），与系统导出的文件一致时为 0')
+@click.option('--dry-run', is_flag=True, help='只校验并生成拒绝报告，不写入数据库')
+@click.option('--force', is_flag=True, help='允许重复导入已完整导入过的文件（上次未完成的导入不带该选项再次执行即可继续）')
+def import_ledger_command(path, site, rejected_path, operator, utc_offset, dry_run, force):
+    """从旧表格（.xlsx / .csv）批量导入历史出入库流水"""
+    if app.config['SITES'] and site not in app.config['SITES']:
+        raise click.UsageError(f'请用 --site 指定仓库: {", ".join(app.config["SITES"])}')
+    rejected_path = rejected_path or f'{os.path.splitext(path)[0]}_rejected.csv'
+    
+    start = time.perf_counter()
+    def progress(summary):
+        print(f'  已写入 {summary["imported"]} 行，拒绝 {summary["rejected"]} 行，{time.perf_counter() - start:.0f} 秒')
+    
+    with site_context(site):
+        try:
+            summary = import_inventory_logs(path, rejected_path, operator=operator, utc_offset=timedelta(hours=utc_offset),
+                                            dry_run=dry_run, force=force, progress=progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    
+    print(f'{site or "默认"}: 读取 {summary["rows"]} 行，{"可导入" if dry_run else "导入"} {summary["imported"]} 行，'
+          f'拒绝 {summary["rejected"]} 行，耗时 {time.perf_counter() - start:.1f} 秒')
+    if summary['resumed_from']:
+        print(f'  继续上次中断的导入：第 {summary["resumed_from"]} 行及之前的 {summary["previously_imported"]} 行已在上次写入')
+    if summary['rejected']:
+        print(f'  拒绝的行已写入 {rejected_path}')
+    for mfg_code, count in summary['unknown_mfg_codes'].most_common(20):
+        print(f'  未找到发货地代码 {mfg_code}: {count} 行')
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        init_supplier_data()
+    for site in app.config['SITES'] or [None]:
+        with site_context(site):
+            init_database()
     app.run(debug=False)
\ No newline at end of file
@@ -0,0 +1,23 @@
+# gevent 异步服务入口：申请状态推送（SSE）等长连接只占用协程，不独占工作线程
+#
+#   python gevent_server.py                        默认监听 0.0.0.0:8000
+#   gunicorn -k gevent -w 2 wsgi:application       或使用 gunicorn 的 gevent worker
+from gevent import monkey
+monkey.patch_all()
+
+import sys
+import os
+
+# 添加项目路径到Python路径
+path = os.path.dirname(os.path.abspath(__file__))
+if path not in sys.path:
+    sys.path.append(path)
+
+from gevent.pywsgi import WSGIServer
+from app import app as application
+
+if __name__ == "__main__":
+    host = os.environ.get('CMC_HOST', '0.0.0.0')
+    port = int(os.environ.get('CMC_PORT', 8000))
+    application.logger.info(f'gevent 服务启动: {host}:{port}')
+    WSGIServer((host, port), application).serve_forever()
@@ -0,0 +1,56 @@
+# gunicorn 生产部署配置（Linux）：预先加载应用后 fork 出多个工作进程
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#
+# 默认使用 gthread 工作模式：SQLite 查询执行时释放 GIL，大批量导出、多仓库汇总的并行查询不会阻塞同一进程的登记。
+# 申请状态推送（SSE）每个连接最长保持 SSE_MAX_DURATION（30 分钟），会一直占用一个线程，
+# 因此每个进程同时保持的推送连接限制为线程数的一半，其余线程留给登记、查询和导出。
+#
+# 可用环境变量调整（括号内为默认值）：
+#   CMC_BIND                监听地址（0.0.0.0:8000）
+#   CMC_WORKERS             工作进程数（CPU 核数 + 1）
+#   CMC_WORKER_CLASS        工作模式（gthread），可改为 gevent（见 README，导出期间会阻塞同进程的其他请求）
+#   CMC_THREADS             gthread 模式下每个进程的线程数（4，小于 2 时按 2）
+#   CMC_SSE_MAX_STREAMS     每个进程同时保持的推送连接上限（gthread 为线程数的一半；gevent 不限），
+#                           超出的连接只返回当前状态，浏览器 30 秒后重连查询
+#   CMC_WORKER_CONNECTIONS  gevent 模式下每个进程的最大并发连接数（1000）
+#   CMC_TIMEOUT             工作进程无响应多少秒后重启（60）
+#   CMC_GRACEFUL_TIMEOUT    重启、停止时等待进行中请求完成的秒数（30）
+#   CMC_LOG_LEVEL           日志级别（INFO），同时作用于应用日志
+#
+# 平滑重启：
+#   kill -HUP <主进程>    重新读取本配置并逐个替换工作进程，进行中的请求处理完再退出。
+#                         由于预先加载了应用，HUP 不会载入新代码
+#   发布新代码：kill -USR2 <主进程> 启动新主进程（加载新代码），确认正常后
+#               kill -WINCH <旧主进程> 停止旧工作进程，再 kill -QUIT <旧主进程>
+#
+# 健康检查：/healthz（进程存活）、/readyz（数据库可读，异常时返回 503）
+import os
+
+worker_class = os.environ.get('CMC_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    # 预先加载应用前打补丁，应用中的锁、条件变量和线程池在工作进程中均为协程版本
+    from gevent import monkey
+    monkey.patch_all()
+    worker_connections = int(os.environ.get('CMC_WORKER_CONNECTIONS', 1000))
+else:
+    # 至少 2 个线程，推送连接不会占满唯一的线程
+    threads = max(int(os.environ.get('CMC_THREADS', 4)), 2)
+    os.environ.setdefault('CMC_SSE_MAX_STREAMS', str(threads // 2))
+
+bind = os.environ.get('CMC_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('CMC_WORKERS', (os.cpu_count() or 1) + 1))
+timeout = int(os.environ.get('CMC_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('CMC_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+loglevel = os.environ.get('CMC_LOG_LEVEL', 'INFO').lower()
+accesslog = '-'
+
+# 主进程加载一次应用，工作进程 fork 后共享已导入的代码，启动快、占用内存少
+preload_app = True
+
+
+def post_fork(server, worker):
+    # 主进程加载应用时可能已打开数据库连接，SQLite 连接不能跨进程共用
+    from app import dispose_engines
+    dispose_engines()
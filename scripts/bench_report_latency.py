@@ -0,0 +1,222 @@
+# 压测：大批量导出期间登记的响应时间
+#
+# 登记线程每隔 50ms 提交一条入库登记，先空闲测一段时间，再在另一个进程（或同一进程）中
+# 导出全部出入库记录，对比两段的登记耗时。使用临时数据库，不会改动 instance 下的数据。
+#
+#   python scripts/bench_report_latency.py                      生成 50 万条流水的临时库
+#   python scripts/bench_report_latency.py --rows 100000
+#   python scripts/bench_report_latency.py --db 某个库的副本.db  使用已有数据库的副本
+#   python scripts/bench_report_latency.py --same-process       导出与登记在同一进程中
+#   python scripts/bench_report_latency.py --gunicorn           按 gunicorn.conf.py 启动服务，经 HTTP 登记和导出
+#                                                               （CMC_WORKER_CLASS 等环境变量照常生效）
+import argparse
+import collections
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPORT_URL = '/system/export-inventory-logs?date_from=2000-01-01'
+
+parser = argparse.ArgumentParser(description='大批量导出期间登记的响应时间')
+parser.add_argument('--db', help='使用该数据库文件的副本（默认生成临时库）')
+parser.add_argument('--rows', type=int, default=500000, help='生成临时库时的流水条数')
+parser.add_argument('--idle', type=float, default=5, help='导出前空闲测量的秒数')
+parser.add_argument('--same-process', action='store_true', help='在登记所在进程中导出')
+parser.add_argument('--gunicorn', action='store_true', help='按 gunicorn.conf.py 启动服务，经 HTTP 登记和导出')
+parser.add_argument('--port', type=int, default=8765, help='--gunicorn 时的监听端口')
+args = parser.parse_args()
+
+# 通过多仓库配置把应用指向临时数据库
+workdir = tempfile.mkdtemp(prefix='cmc-bench-')
+db_path = os.path.join(workdir, 'bench.db')
+if args.db:
+    shutil.copyfile(args.db, db_path)
+sites_file = os.path.join(workdir, 'sites.json')
+with open(sites_file, 'w', encoding='utf-8') as f:
+    json.dump({'BENCH': {'name': '压测', 'database': f'sqlite:///{db_path}'}}, f)
+os.environ['CMC_SITES_FILE'] = sites_file
+sys.path.insert(0, ROOT)
+os.chdir(workdir)  # 应用日志写到临时目录
+
+import app as A
+
+logging.disable(logging.CRITICAL)
+
+
+def seed(rows):
+    """生成供应商和流水（时间倒推，每分钟一条）"""
+    carrier = A.get_carrier('中世')
+    A.db.session.flush()
+    now = datetime.utcnow()
+    A.db.session.execute(A.SupplierInfo.__table__.insert(), [
+        {'supplier_code': f'S{i:03d}', 'mfg_code': f'S{i:03d}-1', 'supplier_name': f'压测供应商{i}',
+         'carrier_id': carrier.id, 'created_at': now, 'updated_at': now}
+        for i in range(200)
+    ])
+    supplier_ids = [s.id for s in A.SupplierInfo.query]
+    A.db.session.commit()
+    start = now - timedelta(minutes=rows)
+    batch = []
+    for k in range(rows):
+        batch.append({
+            'timestamp': start + timedelta(minutes=k),
+            'supplier_id': random.choice(supplier_ids),
+            'operation_code': random.choice([1, 1, 2]),
+            'container_code': random.randint(1, 4),
+            'quantity': random.randint(1, 50),
+            'operator': '登记员'
+        })
+        if len(batch) == 50000 or k == rows - 1:
+            A.db.session.execute(A.InventoryLog.__table__.insert(), batch)
+            batch = []
+    A.db.session.commit()
+    A.rebuild_rollups()
+
+
+with A.site_context('BENCH'):
+    A.init_database()
+    if not args.db:
+        t = time.perf_counter()
+        seed(args.rows)
+        print(f'生成 {args.rows} 条流水，{time.perf_counter() - t:.1f} 秒')
+    mfg_code = A.SupplierInfo.query.first().mfg_code
+    log_count = A.InventoryLog.query.count()
+
+
+def client():
+    c = A.app.test_client()
+    with c.session_transaction() as s:
+        s['system_access'] = True
+        s['registration_access'] = True
+    return c
+
+
+# 经 HTTP 访问 gunicorn 时使用的会话 Cookie（与测试客户端相同的模块权限）
+session_cookie = 'session=' + A.app.session_interface.get_signing_serializer(A.app).dumps(
+    {'system_access': True, 'registration_access': True})
+
+
+def http_request(method, url, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=600)
+    headers = {'Cookie': session_cookie}
+    if body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    conn.request(method, url, body, headers)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+
+def start_gunicorn():
+    env = dict(os.environ, CMC_BIND=f'127.0.0.1:{args.port}', CMC_LOG_LEVEL='WARNING')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--pythonpath', ROOT, '--access-logfile', os.devnull, 'wsgi:application'],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, 'gunicorn.log'), 'w'))
+    for _ in range(100):
+        try:
+            if http_request('GET', '/readyz')[0] == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    sys.exit('gunicorn 未能启动，见 ' + os.path.join(workdir, 'gunicorn.log'))
+
+
+latencies, errors = [], []
+stop = threading.Event()
+
+
+def dock():
+    c = None if args.gunicorn else client()
+    form = {'mfg_code': mfg_code, 'container_type': '塑箱', 'operation_type': 'in', 'quantity': '1'}
+    while not stop.is_set():
+        t = time.perf_counter()
+        if args.gunicorn:
+            try:
+                status = http_request('POST', '/registration', urlencode(form))[0]
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__  # 工作进程被重启等连接错误
+        else:
+            status = c.post('/registration', data=form).status_code
+        latencies.append((time.perf_counter() - t) * 1000)
+        if status != 302:
+            errors.append(status)
+        time.sleep(0.05)
+
+
+def summary(label, values):
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+    print(f'{label}: n={len(values)} p50={pick(0.5):.1f}ms p95={pick(0.95):.1f}ms max={values[-1]:.1f}ms')
+
+
+server = start_gunicorn() if args.gunicorn else None
+thread = threading.Thread(target=dock)
+thread.start()
+time.sleep(args.idle)
+idle = list(latencies)
+latencies.clear()
+
+t = time.perf_counter()
+size, export_error = 0, None
+try:
+    if args.gunicorn:
+        status, data = http_request('GET', EXPORT_URL)
+        size = len(data)
+        if status != 200:
+            export_error = f'HTTP {status}'
+    elif args.same_process:
+        r = client().get(EXPORT_URL)
+        size = len(r.data)
+    else:
+        result = subprocess.run([sys.executable, '-c', f'''
+import logging, sys
+sys.path.insert(0, {ROOT!r})
+import app as A
+logging.disable(logging.CRITICAL)
+c = A.app.test_client()
+with c.session_transaction() as s:
+    s["system_access"] = True
+print(len(c.get({EXPORT_URL!r}).data))
+'''], check=True, capture_output=True, text=True, cwd=workdir)
+        size = int(result.stdout.split()[-1])
+except (OSError, http.client.HTTPException) as e:
+    export_error = f'{type(e).__name__}: {e}'
+finally:
+    export_seconds = time.perf_counter() - t
+    stop.set()
+    thread.join()
+    if server:
+        server.terminate()
+        server.wait()
+
+if args.gunicorn:
+    mode = f'gunicorn {os.environ.get("CMC_WORKER_CLASS", "gthread")}'
+else:
+    mode = '同一进程' if args.same_process else '独立进程'
+print(f'流水 {log_count} 条，导出 {size / 1e6:.1f} MB，耗时 {export_seconds:.1f} 秒（{mode}）')
+if export_error:
+    print(f'导出失败: {export_error}')
+if args.gunicorn:
+    with open(os.path.join(workdir, 'gunicorn.log'), encoding='utf-8', errors='replace') as f:
+        timeouts = f.read().count('WORKER TIMEOUT')
+    if timeouts:
+        print(f'工作进程因阻塞超时被重启 {timeouts} 次')
+summary('空闲时登记', idle)
+summary('导出时登记', latencies)
+print(f'登记失败 {len(errors)} 次' + (f'：{collections.Counter(errors).most_common()}' if errors else ''))
+shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,94 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const table = document.getElementById('requestTable');
+    if (!table) {
+        return;
+    }
+    
+    const statusFilter = table.dataset.statusFilter;
+    const selectAll = document.getElementById('selectAll');
+    const bulkButtons = document.querySelectorAll('[data-bulk-status]');
+    const resultDiv = document.getElementById('bulkResult');
+    const statusBadges = {
+        pending: '<span class="badge bg-warning"><i class="fas fa-clock me-1"></i>待审批</span>',
+        approved: '<span class="badge bg-success"><i class="fas fa-check me-1"></i>已批准</span>',
+        completed: '<span class="badge bg-info"><i class="fas fa-flag-checkered me-1"></i>已完成</span>'
+    };
+    
+    function selectedIds() {
+        return Array.from(table.querySelectorAll('.row-select:checked')).map(cb => parseInt(cb.value));
+    }
+    
+    function refreshBulkButtons() {
+        const count = selectedIds().length;
+        bulkButtons.forEach(btn => btn.disabled = count === 0);
+    }
+    
+    // 更新单行显示：状态标签、按钮可用性；不再符合当前筛选的行移除
+    function applyStatus(id, status) {
+        const row = table.querySelector(`tr[data-id="${id}"]`);
+        if (!row) {
+            return;
+        }
+        if (statusFilter !== 'all' && statusFilter !== status) {
+            row.remove();
+            return;
+        }
+        row.dataset.status = status;
+        row.querySelector('.status-cell').innerHTML = statusBadges[status];
+        row.querySelector('button[value="approved"]').disabled = status !== 'pending';
+        row.querySelector('button[value="completed"]').disabled = status === 'completed';
+        row.querySelector('.row-select').checked = false;
+    }
+    
+    function updateStatus(ids, status) {
+        return fetch('/update-requests', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ids: ids, status: status})
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                data.updated.forEach(id => applyStatus(id, data.status));
+                let message = `已更新 ${data.updated.length} 条申请`;
+                if (data.skipped.length) {
+                    message += `，跳过 ${data.skipped.length} 条（状态不允许变更）`;
+                }
+                resultDiv.className = `alert alert-${data.skipped.length ? 'warning' : 'success'}`;
+                resultDiv.textContent = message;
+                resultDiv.style.display = 'block';
+                refreshBulkButtons();
+            })
+            .catch(error => {
+                resultDiv.className = 'alert alert-danger';
+                resultDiv.textContent = `状态更新失败：${error.message}`;
+                resultDiv.style.display = 'block';
+            });
+    }
+    
+    selectAll.addEventListener('change', function() {
+        table.querySelectorAll('.row-select').forEach(cb => cb.checked = selectAll.checked);
+        refreshBulkButtons();
+    });
+    table.addEventListener('change', function(e) {
+        if (e.target.classList.contains('row-select')) {
+            refreshBulkButtons();
+        }
+    });
+    
+    bulkButtons.forEach(btn => btn.addEventListener('click', function() {
+        const ids = selectedIds();
+        if (ids.length) {
+            updateStatus(ids, btn.dataset.bulkStatus);
+        }
+    }));
+    
+    // 单条操作同样走批量接口，无需整页刷新
+    table.querySelectorAll('.status-form').forEach(form => form.addEventListener('submit', function(e) {
+        e.preventDefault();
+        const row = form.closest('tr');
+        updateStatus([parseInt(row.dataset.id)], e.submitter.value);
+    }));
+});
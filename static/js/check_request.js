@@ -0,0 +1,27 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 申请状态实时更新：服务器推送状态变更，无需手动刷新页面
+    const requestInfo = document.getElementById('requestInfo');
+    if (!requestInfo || !window.EventSource || requestInfo.dataset.status === 'completed') {
+        return;
+    }
+    
+    const statusBadges = {
+        pending: '<span class="badge bg-warning status-badge">待审批</span>',
+        approved: '<span class="badge bg-success status-badge">已批准</span>',
+        completed: '<span class="badge bg-info status-badge">已完成</span>'
+    };
+    const statusBadge = document.getElementById('statusBadge');
+    const requestId = encodeURIComponent(requestInfo.dataset.requestId);
+    const source = new EventSource(`/check-request/${requestId}/events`);
+    
+    source.addEventListener('status', function(event) {
+        const data = JSON.parse(event.data);
+        if (data.status !== requestInfo.dataset.status) {
+            requestInfo.dataset.status = data.status;
+            statusBadge.innerHTML = statusBadges[data.status] || '';
+        }
+        if (data.status === 'completed') {
+            source.close();
+        }
+    });
+});
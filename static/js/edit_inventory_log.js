@@ -0,0 +1,50 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const mfgCodeInput = document.getElementById('mfg_code');
+    const supplierInfoDiv = document.getElementById('supplierInfo');
+    const supplierCodeSpan = document.getElementById('supplierCode');
+    const supplierNameSpan = document.getElementById('supplierName');
+    const carrierInfoSpan = document.getElementById('carrierInfo');
+    
+    // 当MFG代码输入框失去焦点时，获取供应商信息（优先在本地供应商字典中查找）
+    mfgCodeInput.addEventListener('blur', function() {
+        const mfgCode = mfgCodeInput.value.trim();
+        
+        const supplier = SupplierDictionary.lookup(mfgCode);
+        
+        if (supplier) {
+            supplierCodeSpan.textContent = supplier.supplier_code;
+            supplierNameSpan.textContent = supplier.supplier_name;
+            carrierInfoSpan.textContent = supplier.carrier;
+            supplierInfoDiv.style.display = 'block';
+        } else if (mfgCode) {
+            // 本地字典中没有时再向服务器确认
+            fetch(`/api/supplier-info/${mfgCode}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('未找到供应商信息');
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    supplierCodeSpan.textContent = data.supplier_code;
+                    supplierNameSpan.textContent = data.supplier_name;
+                    carrierInfoSpan.textContent = data.carrier;
+                    supplierInfoDiv.style.display = 'block';
+                })
+                .catch(error => {
+                    alert(error.message);
+                    supplierCodeSpan.textContent = '-';
+                    supplierNameSpan.textContent = '-';
+                    carrierInfoSpan.textContent = '-';
+                    supplierInfoDiv.style.display = 'block';
+                });
+        } else {
+            supplierInfoDiv.style.display = 'none';
+        }
+    });
+    
+    // 页面加载时触发一次供应商信息显示
+    if (mfgCodeInput.value.trim()) {
+        supplierInfoDiv.style.display = 'block';
+    }
+});
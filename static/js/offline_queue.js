@@ -0,0 +1,120 @@
+// 离线登记队列：登记先按提交顺序保存在 IndexedDB，再分批上传到 /api/registrations
+// 每条登记带客户端生成的唯一键，重复上传不会重复入账。页面和 Service Worker 共用
+const OfflineQueue = (function() {
+    const DB_NAME = 'cmc-registration';
+    const QUEUE_STORE = 'queue';
+    const REJECTED_STORE = 'rejected';
+    const SYNC_URL = '/api/registrations';
+    const BATCH_SIZE = 50;
+    let syncing = null;
+
+    function openDb() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(QUEUE_STORE, { keyPath: 'seq', autoIncrement: true });
+                request.result.createObjectStore(REJECTED_STORE, { keyPath: 'key' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    // 在一个事务中执行 fn(store...)，事务完成后返回 fn 的结果
+    async function withStores(names, mode, fn) {
+        const db = await openDb();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(names, mode);
+            const result = fn(...names.map(name => tx.objectStore(name)));
+            tx.oncomplete = () => { db.close(); resolve(result && 'result' in result ? result.result : result); };
+            tx.onerror = () => { db.close(); reject(tx.error); };
+        });
+    }
+
+    function newKey() {
+        if (self.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        // 非 HTTPS 页面没有 randomUUID，用随机数拼出同样格式的键
+        const bytes = crypto.getRandomValues(new Uint8Array(16));
+        bytes[6] = (bytes[6] & 0x0f) | 0x40;
+        bytes[8] = (bytes[8] & 0x3f) | 0x80;
+        const hex = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+        return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+    }
+
+    function add(entry) {
+        const record = Object.assign({ key: newKey(), recorded_at: new Date().toISOString() }, entry);
+        return withStores([QUEUE_STORE], 'readwrite', store => { store.add(record); }).then(() => record);
+    }
+
+    function count() {
+        return withStores([QUEUE_STORE], 'readonly', store => store.count());
+    }
+
+    function pending() {
+        return withStores([QUEUE_STORE], 'readonly', store => store.getAll());
+    }
+
+    // 取出后台同步时被拒绝的登记（取出即清除）
+    function takeRejected() {
+        return withStores([REJECTED_STORE], 'readwrite', store => {
+            const request = store.getAll();
+            store.clear();
+            return request;
+        });
+    }
+
+    async function uploadBatch(batch) {
+        const response = await fetch(SYNC_URL, {
+            method: 'POST',
+            credentials: 'same-origin',
+            redirect: 'manual',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ entries: batch.map(({ seq, ...entry }) => entry) })
+        });
+        if (response.type === 'opaqueredirect') {
+            throw new Error('登录已失效，请重新登录后同步');
+        }
+        if (!response.ok) {
+            throw new Error(`同步失败（${response.status}）`);
+        }
+        return (await response.json()).results;
+    }
+
+    // 按提交顺序分批上传；已入账、重复和被拒绝的都移出队列，被拒绝的另存以便页面提示
+    async function drain() {
+        const results = [];
+        for (;;) {
+            const batch = (await pending()).slice(0, BATCH_SIZE);
+            if (!batch.length) {
+                return results;
+            }
+            const batchResults = await uploadBatch(batch);
+            const byKey = new Map(batchResults.map(result => [result.key, result]));
+            await withStores([QUEUE_STORE, REJECTED_STORE], 'readwrite', (queue, rejected) => {
+                batch.forEach(entry => {
+                    const result = byKey.get(entry.key);
+                    if (!result) {
+                        return;
+                    }
+                    queue.delete(entry.seq);
+                    if (result.status === 'rejected') {
+                        rejected.put(Object.assign({}, entry, { message: result.message }));
+                    }
+                });
+            });
+            results.push(...batchResults.map(result => Object.assign({ entry: batch.find(e => e.key === result.key) }, result)));
+        }
+    }
+
+    // 同一上下文中只运行一个同步；不同上下文同时上传时由服务器按唯一键去重
+    function sync() {
+        if (!syncing) {
+            syncing = drain().finally(() => { syncing = null; });
+        }
+        return syncing;
+    }
+
+    return { add, count, sync, takeRejected };
+})();
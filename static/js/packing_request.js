@@ -0,0 +1,66 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 设置返空日期的最小值为今天
+    const today = new Date().toISOString().split('T')[0];
+    document.querySelector('input[name="return_date"]').min = today;
+    
+    // 动态添加物品功能
+    document.getElementById('add-item').addEventListener('click', function() {
+        const container = document.getElementById('items-container');
+        const firstRow = container.querySelector('.item-row');
+        const newRow = firstRow.cloneNode(true);
+        
+        // 清空新行的输入值
+        newRow.querySelector('.mfg-code').value = '';
+        newRow.querySelector('.container-type').value = '';
+        
+        // 显示删除按钮
+        newRow.querySelector('.remove-item').style.display = 'block';
+        
+        // 重新绑定事件
+        bindRowEvents(newRow);
+        
+        container.appendChild(newRow);
+    });
+
+    // 绑定行事件
+    function bindRowEvents(row) {
+        const mfgCodeInput = row.querySelector('.mfg-code');
+        const containerTypeSelect = row.querySelector('.container-type');
+        const removeBtn = row.querySelector('.remove-item');
+        
+        // 删除按钮事件
+        removeBtn.addEventListener('click', function() {
+            row.remove();
+        });
+    }
+
+    // 初始绑定第一行事件
+    bindRowEvents(document.querySelector('.item-row'));
+
+    // 表单提交前验证
+    document.getElementById('packingForm').addEventListener('submit', function(e) {
+        // 验证是否有至少一个物品
+        const itemRows = document.querySelectorAll('.item-row');
+        if (itemRows.length === 0) {
+            e.preventDefault();
+            alert('请至少添加一个返空物品');
+            return;
+        }
+        
+        // 验证每个物品是否填写完整
+        let hasError = false;
+        itemRows.forEach(row => {
+            const mfgCode = row.querySelector('.mfg-code').value;
+            const containerType = row.querySelector('.container-type').value;
+            
+            if (!mfgCode || !containerType) {
+                hasError = true;
+            }
+        });
+        
+        if (hasError) {
+            e.preventDefault();
+            alert('请确保所有物品的发货地代码和空器具类型都已填写完整');
+        }
+    });
+});
@@ -0,0 +1,232 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const mfgCodeInput = document.getElementById('mfg_code');
+    const supplierInfoDiv = document.getElementById('supplierInfo');
+    const supplierCodeSpan = document.getElementById('supplierCode');
+    const supplierNameSpan = document.getElementById('supplierName');
+    const carrierInfoSpan = document.getElementById('carrierInfo');
+    const submitBtn = document.getElementById('submitBtn');
+    const containerTypeSelect = document.querySelector('select[name="container_type"]');
+    const quantityInput = document.getElementById('quantityInput');
+    const stockInfoSpan = document.getElementById('stockInfo');
+    const stockWarningSpan = document.getElementById('stockWarning');
+    const operationTypeSelect = document.querySelector('select[name="operation_type"]');
+    
+    function showSupplier(data) {
+        supplierCodeSpan.textContent = data.supplier_code;
+        supplierNameSpan.textContent = data.supplier_name;
+        carrierInfoSpan.textContent = data.carrier;
+        supplierInfoDiv.style.display = 'block';
+        submitBtn.disabled = false;
+    }
+    
+    // 输入时在本地供应商字典中查找，找到即显示，无需请求服务器
+    mfgCodeInput.addEventListener('input', function() {
+        const supplier = SupplierDictionary.lookup(mfgCodeInput.value.trim());
+        if (supplier) {
+            showSupplier(supplier);
+            updateStockInfo();
+        }
+    });
+    
+    // 当MFG代码输入框失去焦点时，获取供应商信息（本地字典中没有时再向服务器确认，可能是刚新增的供应商）
+    mfgCodeInput.addEventListener('blur', function() {
+        const mfgCode = mfgCodeInput.value.trim();
+        const supplier = SupplierDictionary.lookup(mfgCode);
+        
+        if (supplier) {
+            showSupplier(supplier);
+        } else if (mfgCode) {
+            fetch(`/api/supplier-info/${mfgCode}`)
+                .catch(() => {
+                    // 离线时无法查询，允许先保存，同步时由服务器校验
+                    throw Object.assign(new Error('网络不可用，提交后将在同步时校验发货地代码'), { offline: true });
+                })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('未找到供应商信息');
+                    }
+                    return response.json();
+                })
+                .then(showSupplier)
+                .catch(error => {
+                    if (error.offline) {
+                        supplierCodeSpan.textContent = '-';
+                        supplierNameSpan.textContent = error.message;
+                        carrierInfoSpan.textContent = '-';
+                        supplierInfoDiv.style.display = 'block';
+                        submitBtn.disabled = false;
+                        return;
+                    }
+                    alert(error.message);
+                    supplierInfoDiv.style.display = 'none';
+                    submitBtn.disabled = true;
+                });
+        } else {
+            supplierInfoDiv.style.display = 'none';
+            submitBtn.disabled = true;
+        }
+        
+        // 同时更新库存信息
+        updateStockInfo();
+    });
+    
+    // 各发货地代码所有器具类型的库存，一次请求后缓存，登记同步后清空
+    const stockCache = new Map();
+    
+    function loadStock(mfgCode) {
+        if (!stockCache.has(mfgCode)) {
+            const request = fetch(`/api/stock/${encodeURIComponent(mfgCode)}`)
+                .then(response => response.json())
+                .then(data => data.stock);
+            request.catch(() => stockCache.delete(mfgCode));
+            stockCache.set(mfgCode, request);
+        }
+        return stockCache.get(mfgCode);
+    }
+    
+    // 更新库存信息
+    function updateStockInfo() {
+        const mfgCode = mfgCodeInput.value.trim();
+        const containerType = containerTypeSelect.value;
+        const operationType = operationTypeSelect.value;
+        
+        if (mfgCode && containerType) {
+            loadStock(mfgCode)
+                .then(stock => {
+                    const currentStock = stock[containerType] || 0;
+                    stockInfoSpan.textContent = `当前库存: ${currentStock}`;
+                    
+                    // 如果是出库操作，显示警告并设置最大数量
+                    if (operationType === 'out') {
+                        stockWarningSpan.style.display = 'inline';
+                        quantityInput.max = currentStock;
+                    } else {
+                        stockWarningSpan.style.display = 'none';
+                        quantityInput.removeAttribute('max');
+                    }
+                })
+                .catch(error => {
+                    console.error('Error checking stock:', error);
+                    stockInfoSpan.textContent = '当前库存: 获取失败';
+                });
+        } else {
+            stockInfoSpan.textContent = '当前库存: 请输入发货地代码并选择空器具类型';
+            stockWarningSpan.style.display = 'none';
+        }
+    }
+    
+    // 当空器具类型或操作类型变化时更新库存信息
+    containerTypeSelect.addEventListener('change', updateStockInfo);
+    operationTypeSelect.addEventListener('change', updateStockInfo);
+    
+    // 表单提交前验证
+    const registrationForm = document.getElementById('registrationForm');
+    registrationForm.addEventListener('submit', function(e) {
+        const operationType = operationTypeSelect.value;
+        const quantity = parseInt(quantityInput.value);
+        const maxQuantity = parseInt(quantityInput.max);
+        
+        if (operationType === 'out' && quantity > maxQuantity) {
+            e.preventDefault();
+            alert(`出库数量(${quantity})超过当前库存(${maxQuantity})，请调整数量`);
+            return;
+        }
+        
+        // 支持 IndexedDB 时先存入本机队列再同步，断网不丢失、重试不重复
+        if (!window.indexedDB) {
+            return;
+        }
+        e.preventDefault();
+        OfflineQueue.add({
+            operation_type: operationType,
+            container_type: containerTypeSelect.value,
+            quantity: quantity,
+            mfg_code: mfgCodeInput.value.trim(),
+            notes: registrationForm.elements.notes.value
+        }).then(() => {
+            quantityInput.value = '';
+            registrationForm.elements.notes.value = '';
+            return syncQueue();
+        }).catch(error => showMessage('error', `保存登记失败：${error.message}`));
+    });
+    
+    // 离线登记队列
+    const offlineStatus = document.getElementById('offlineStatus');
+    const pendingCountSpan = document.getElementById('pendingCount');
+    const syncMessages = document.getElementById('syncMessages');
+    const operationNames = { in: '入库', out: '出库' };
+    
+    function showMessage(category, text) {
+        const alertDiv = document.createElement('div');
+        alertDiv.className = `alert alert-${category === 'error' ? 'danger' : 'success'} alert-dismissible fade show`;
+        alertDiv.setAttribute('role', 'alert');
+        alertDiv.innerHTML = `<i class="fas fa-${category === 'error' ? 'exclamation-triangle' : 'check-circle'} me-2"></i>` +
+            '<span></span><button type="button" class="btn-close" data-bs-dismiss="alert"></button>';
+        alertDiv.querySelector('span').textContent = text;
+        syncMessages.prepend(alertDiv);
+    }
+    
+    function showRejected(entry, message) {
+        showMessage('error', `${operationNames[entry.operation_type] || ''}登记未入账（${entry.mfg_code} ${entry.container_type} ×${entry.quantity}）：${message}`);
+    }
+    
+    function updatePendingCount() {
+        return OfflineQueue.count().then(count => {
+            pendingCountSpan.textContent = count;
+            offlineStatus.style.display = count ? 'block' : 'none';
+        });
+    }
+    
+    function syncQueue() {
+        return OfflineQueue.sync()
+            .then(results => {
+                results.forEach(result => {
+                    if (result.status === 'created') {
+                        showMessage('success', `${operationNames[result.operation_type]}登记成功！数量：${result.quantity}`);
+                    } else if (result.status === 'duplicate') {
+                        showMessage('success', `登记已入账（${result.entry.mfg_code} ×${result.entry.quantity}），重复上传已忽略`);
+                    } else {
+                        showRejected(result.entry, result.message);
+                    }
+                });
+                // 丢弃本页已提示过的拒绝记录，只显示后台同步时被拒绝的
+                return OfflineQueue.takeRejected().then(rejected => rejected
+                    .filter(entry => !results.some(result => result.key === entry.key))
+                    .forEach(entry => showRejected(entry, entry.message)));
+            })
+            .catch(error => {
+                showMessage('error', navigator.onLine === false || error instanceof TypeError
+                    ? '网络不可用，登记已保存在本机，恢复网络后自动同步'
+                    : error.message);
+                // 网络恢复后由 Service Worker 在后台同步（浏览器支持时）
+                if (navigator.serviceWorker && window.SyncManager) {
+                    navigator.serviceWorker.ready.then(reg => reg.sync.register('cmc-registration-sync')).catch(() => {});
+                }
+            })
+            .finally(() => {
+                stockCache.clear();
+                updatePendingCount();
+                updateStockInfo();
+            });
+    }
+    
+    document.getElementById('syncNowBtn').addEventListener('click', syncQueue);
+    window.addEventListener('online', syncQueue);
+    setInterval(() => {
+        if (pendingCountSpan.textContent !== '0') {
+            syncQueue();
+        }
+    }, 30000);
+    if (window.indexedDB) {
+        syncQueue();
+    }
+    
+    // 注册 Service Worker，并把页面引用的脚本、样式交给它缓存，离线时也能打开登记页面
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').then(() => navigator.serviceWorker.ready).then(reg => {
+            const urls = Array.from(document.querySelectorAll('script[src], link[rel="stylesheet"][href]'))
+                .map(el => el.src || el.href);
+            reg.active.postMessage({ type: 'cache-assets', urls: urls });
+        }).catch(error => console.error('Service Worker 注册失败:', error));
+    }
+});
@@ -0,0 +1,47 @@
+// 供应商字典：下载一次后缓存在 localStorage，之后打开页面只做一次 304 校验，输入时在本地查找
+// 离线时使用上次缓存的字典
+const SupplierDictionary = (function() {
+    const DICTIONARY_URL = '/api/supplier-dictionary';
+    const STORAGE_KEY = 'cmc-supplier-dictionary';
+    let suppliers = null;
+
+    function readCache() {
+        try {
+            return JSON.parse(localStorage.getItem(STORAGE_KEY));
+        } catch (e) {
+            return null;
+        }
+    }
+
+    const ready = (async function() {
+        const cached = readCache();
+        if (cached) {
+            suppliers = cached.suppliers;
+        }
+        try {
+            const response = await fetch(DICTIONARY_URL, {
+                headers: cached && cached.etag ? { 'If-None-Match': cached.etag } : {}
+            });
+            if (response.status === 200) {
+                const data = await response.json();
+                suppliers = data.suppliers;
+                try {
+                    localStorage.setItem(STORAGE_KEY, JSON.stringify({ etag: response.headers.get('ETag'), suppliers: suppliers }));
+                } catch (e) {
+                    console.error('供应商字典缓存失败:', e);
+                }
+            }
+        } catch (e) {
+            // 网络不可用时沿用缓存
+        }
+        return suppliers !== null;
+    })();
+
+    // 返回 {supplier_code, supplier_name, carrier}，字典中没有时返回 null
+    function lookup(mfgCode) {
+        const row = suppliers && suppliers[mfgCode];
+        return row ? { supplier_code: row[0], supplier_name: row[1], carrier: row[2] } : null;
+    }
+
+    return { ready, lookup };
+})();
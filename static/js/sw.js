@@ -0,0 +1,62 @@
+// 登记页面 Service Worker：离线时提供缓存的页面和静态资源，网络恢复后在后台同步登记队列
+importScripts('/static/js/offline_queue.js');
+
+const CACHE_NAME = 'cmc-registration-v1';
+const SYNC_TAG = 'cmc-registration-sync';
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names.filter(name => name !== CACHE_NAME).map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// 页面把自身引用的脚本、样式地址发来预先缓存
+self.addEventListener('message', event => {
+    if (event.data && event.data.type === 'cache-assets') {
+        event.waitUntil(caches.open(CACHE_NAME).then(cache => Promise.all(event.data.urls.map(url =>
+            caches.match(url).then(hit => hit || fetch(url, { mode: url.startsWith(self.location.origin) ? 'same-origin' : 'no-cors' })
+                .then(response => cache.put(url, response))
+                .catch(() => null))
+        ))));
+    }
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+
+    // 登记页面：优先网络，离线时使用最近一次成功打开的页面
+    if (request.mode === 'navigate' && url.origin === self.location.origin && url.pathname === '/registration') {
+        event.respondWith(
+            fetch(request)
+                .then(response => {
+                    if (response.ok && !response.redirected) {
+                        const copy = response.clone();
+                        caches.open(CACHE_NAME).then(cache => cache.put('/registration', copy));
+                    }
+                    return response;
+                })
+                .catch(() => caches.match('/registration'))
+        );
+        return;
+    }
+
+    // 静态资源（地址带内容哈希或为固定版本的 CDN 文件）优先使用缓存，其他请求不经过 Service Worker
+    if (url.origin === self.location.origin && !url.pathname.startsWith('/static/')) {
+        return;
+    }
+    event.respondWith(caches.match(request).then(hit => hit || fetch(request)));
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(OfflineQueue.sync());
+    }
+});
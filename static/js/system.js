@@ -0,0 +1,105 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 编辑供应商模态框数据填充
+    const editModal = document.getElementById('editSupplierModal');
+    editModal.addEventListener('show.bs.modal', function(event) {
+        const button = event.relatedTarget;
+        const supplierId = button.getAttribute('data-id');
+        const supplierCode = button.getAttribute('data-supplier-code');
+        const mfgCode = button.getAttribute('data-mfg-code');
+        const supplierName = button.getAttribute('data-supplier-name');
+        const carrier = button.getAttribute('data-carrier');
+        
+        document.getElementById('edit_supplier_code').value = supplierCode;
+        document.getElementById('edit_mfg_code').value = mfgCode;
+        document.getElementById('edit_supplier_name').value = supplierName;
+        document.getElementById('edit_carrier').value = carrier;
+        
+        // 更新表单action
+        document.getElementById('editSupplierForm').action = `/system/edit-supplier/${supplierId}`;
+    });
+    
+    // 供应商列表分页加载
+    const tableBody = document.getElementById('supplierTableBody');
+    const emptyDiv = document.getElementById('supplierEmpty');
+    const pageInfo = document.getElementById('supplierPageInfo');
+    const prevBtn = document.getElementById('supplierPrev');
+    const nextBtn = document.getElementById('supplierNext');
+    const searchInput = document.getElementById('supplierSearch');
+    let currentPage = 1;
+    let searchTimer = null;
+    
+    function cell(text) {
+        const td = document.createElement('td');
+        td.textContent = text;
+        return td;
+    }
+    
+    function renderRow(supplier) {
+        const tr = document.createElement('tr');
+        tr.appendChild(cell(supplier.supplier_code));
+        tr.appendChild(cell(supplier.mfg_code));
+        tr.appendChild(cell(supplier.supplier_name));
+        tr.appendChild(cell(supplier.carrier));
+        tr.appendChild(cell(supplier.created_at));
+        
+        const actions = document.createElement('td');
+        const editBtn = document.createElement('button');
+        editBtn.type = 'button';
+        editBtn.className = 'btn btn-sm btn-outline-primary me-1';
+        editBtn.textContent = '编辑';
+        editBtn.setAttribute('data-bs-toggle', 'modal');
+        editBtn.setAttribute('data-bs-target', '#editSupplierModal');
+        editBtn.setAttribute('data-id', supplier.id);
+        editBtn.setAttribute('data-supplier-code', supplier.supplier_code);
+        editBtn.setAttribute('data-mfg-code', supplier.mfg_code);
+        editBtn.setAttribute('data-supplier-name', supplier.supplier_name);
+        editBtn.setAttribute('data-carrier', supplier.carrier);
+        actions.appendChild(editBtn);
+        
+        const deleteForm = document.createElement('form');
+        deleteForm.method = 'POST';
+        deleteForm.action = `/system/delete-supplier/${supplier.id}`;
+        deleteForm.className = 'd-inline';
+        deleteForm.addEventListener('submit', function(e) {
+            if (!confirm('确定要删除这个供应商吗？')) {
+                e.preventDefault();
+            }
+        });
+        const deleteBtn = document.createElement('button');
+        deleteBtn.type = 'submit';
+        deleteBtn.className = 'btn btn-sm btn-outline-danger';
+        deleteBtn.textContent = '删除';
+        deleteForm.appendChild(deleteBtn);
+        actions.appendChild(deleteForm);
+        
+        tr.appendChild(actions);
+        return tr;
+    }
+    
+    function loadSuppliers(page) {
+        const params = new URLSearchParams({page: page, q: searchInput.value.trim()});
+        fetch(`/api/suppliers?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                tableBody.replaceChildren(...data.items.map(renderRow));
+                emptyDiv.style.display = data.total ? 'none' : 'block';
+                currentPage = data.page;
+                pageInfo.textContent = data.total ? `共 ${data.total} 条，第 ${data.page}/${data.pages} 页` : '';
+                prevBtn.disabled = data.page <= 1;
+                nextBtn.disabled = data.page >= data.pages;
+            })
+            .catch(error => {
+                console.error('Error loading suppliers:', error);
+                pageInfo.textContent = '供应商列表加载失败';
+            });
+    }
+    
+    prevBtn.addEventListener('click', () => loadSuppliers(currentPage - 1));
+    nextBtn.addEventListener('click', () => loadSuppliers(currentPage + 1));
+    searchInput.addEventListener('input', function() {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => loadSuppliers(1), 300);
+    });
+    
+    loadSuppliers(1);
+});
@@ -1,3 +1,7 @@
+# WSGI 入口
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application   生产部署（配置见 gunicorn.conf.py）
+#   python wsgi.py                                   本机调试，使用 Werkzeug 开发服务器
 import sys
 import os
 